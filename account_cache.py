@@ -0,0 +1,236 @@
+"""
+On-disk cache of the public parts of derived wallet accounts.
+
+A cache file holds the accounts m/0/target .. m/(n-1)/target below one account
+node, identified by the root key fingerprint, network, derivation path and
+target. Its layout is
+
+    header   magic, version, record count, xpub length
+    xpub     the account node xpub, checked when the file is opened
+    offsets  count + 1 little-endian u64 record offsets
+    records  msgpack lists [public_key, *coin public fields]
+
+The file is memory-mapped and records are decoded on access, so opening it
+does not depend on the number of accounts. Private keys are never written,
+accounts read from the cache derive them on first use.
+"""
+from collections.abc import MutableMapping
+import mmap
+import os
+import struct
+
+import msgpack
+
+from n_types import IWalletAccount
+
+ACCOUNT_CACHE_MAGIC = b'NWAC'
+# 2: address scripts stored as bytes
+ACCOUNT_CACHE_VERSION = 2
+
+_HEADER = struct.Struct('<4sHIH')
+_OFFSET = struct.Struct('<Q')
+
+
+def account_cache_path(directory, fingerprint, network, root, root_path1, root_path2, target):
+    return os.path.join(directory,
+                        f'{fingerprint}-{network}-{root}-{root_path1}-{root_path2}-{target}.accounts')
+
+
+class AccountCache:
+    """
+    Memory-mapped account cache file, see the module docstring.
+
+    A missing file, or one written for another xpub or format version, opens
+    as an empty cache.
+    """
+    def __init__(self, path, xpub):
+        self.path = path
+        self.xpub = xpub
+        self._file = None
+        self._map = None
+        self._count = 0
+        self._offsets_at = 0
+        self._open()
+
+    def _open(self):
+        self.close()
+        try:
+            file = open(self.path, 'rb')
+        except FileNotFoundError:
+            return
+        try:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty file
+            file.close()
+            return
+        magic, version, count, xpub_size = _HEADER.unpack_from(data, 0)
+        xpub = data[_HEADER.size:_HEADER.size + xpub_size].decode()
+        if magic != ACCOUNT_CACHE_MAGIC or version != ACCOUNT_CACHE_VERSION or xpub != self.xpub:
+            data.close()
+            file.close()
+            return
+        self._file = file
+        self._map = data
+        self._count = count
+        self._offsets_at = _HEADER.size + xpub_size
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._file.close()
+        self._file = None
+        self._map = None
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def record(self, index):
+        """
+        Returns the [public_key, *coin public fields] record of account `index`.
+        """
+        if not 0 <= index < self._count:
+            raise IndexError(index)
+        start, = _OFFSET.unpack_from(self._map, self._offsets_at + index * _OFFSET.size)
+        end, = _OFFSET.unpack_from(self._map, self._offsets_at + (index + 1) * _OFFSET.size)
+        return msgpack.unpackb(self._map[start:end], raw=False)
+
+    def extend(self, records):
+        """
+        Appends the records of the accounts following the cached ones and
+        rewrites the file atomically.
+        """
+        blobs = [self._map[self._record_span(index)] for index in range(self._count)]
+        blobs += [msgpack.packb(list(record), use_bin_type=True) for record in records]
+        xpub = self.xpub.encode()
+        offset = _HEADER.size + len(xpub) + (len(blobs) + 1) * _OFFSET.size
+        offsets = []
+        for blob in blobs:
+            offsets.append(offset)
+            offset += len(blob)
+        offsets.append(offset)
+
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        temp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(temp_path, 'wb') as file:
+            file.write(_HEADER.pack(ACCOUNT_CACHE_MAGIC, ACCOUNT_CACHE_VERSION, len(blobs), len(xpub)))
+            file.write(xpub)
+            file.write(b''.join(_OFFSET.pack(offset) for offset in offsets))
+            file.write(b''.join(blobs))
+        self.close()
+        os.replace(temp_path, self.path)
+        self._open()
+
+    def _record_span(self, index):
+        start, = _OFFSET.unpack_from(self._map, self._offsets_at + index * _OFFSET.size)
+        end, = _OFFSET.unpack_from(self._map, self._offsets_at + (index + 1) * _OFFSET.size)
+        return slice(start, end)
+
+
+class LazyWalletAccount(IWalletAccount):
+    """
+    Account read from an AccountCache. Its private fields are filled in by
+    `resolve(account)` on first access.
+    """
+    __slots__ = ('_resolve', '_private_key', '_tweaked_private_key')
+
+    def __init__(self, resolve, **fields):
+        self._resolve = resolve
+        super().__init__(private_key=None, **fields)
+
+    def _resolve_private_fields(self):
+        resolve, self._resolve = self._resolve, None
+        if resolve is not None:
+            resolve(self)
+
+    @property
+    def private_key(self):
+        if self._private_key is None:
+            self._resolve_private_fields()
+        return self._private_key
+
+    @private_key.setter
+    def private_key(self, value):
+        self._private_key = value
+
+    @property
+    def tweaked_private_key(self):
+        if self._tweaked_private_key is None:
+            self._resolve_private_fields()
+        return self._tweaked_private_key
+
+    @tweaked_private_key.setter
+    def tweaked_private_key(self, value):
+        self._tweaked_private_key = value
+
+
+class AccountCollection(MutableMapping):
+    """
+    account_collection of a wallet, a dict of accounts by ext_path that can also
+    expose AccountCache files. Cached accounts are built on first access.
+    """
+    def __init__(self):
+        self._accounts = {}
+        # target -> (cache, build(index) -> account, exposed account count)
+        self._caches = {}
+        self._deleted = set()
+        # Incremented on every change, tells indexes built over the accounts they are stale
+        self.version = 0
+
+    def attach(self, cache, target, build, count):
+        """
+        Exposes the first `count` accounts of `cache` as m/index/target.
+        """
+        previous = self._caches.get(target)
+        if previous is not None and previous[0] is cache:
+            count = max(count, previous[2])
+        self._caches[target] = (cache, build, min(count, len(cache)))
+        self.version += 1
+
+    def _cached_index(self, key):
+        try:
+            _, index, target = key.split('/')
+            index, target = int(index), int(target)
+        except (AttributeError, ValueError):
+            return None, None
+        cache = self._caches.get(target)
+        if cache is None or not 0 <= index < cache[2] or key in self._deleted:
+            return None, None
+        return index, cache[1]
+
+    def __getitem__(self, key):
+        account = self._accounts.get(key)
+        if account is not None:
+            return account
+        index, build = self._cached_index(key)
+        if index is None:
+            raise KeyError(key)
+        account = self._accounts[key] = build(index)
+        return account
+
+    def __setitem__(self, key, account):
+        self._deleted.discard(key)
+        self._accounts[key] = account
+        self.version += 1
+
+    def __delitem__(self, key):
+        if self._cached_index(key)[0] is not None:
+            self._deleted.add(key)
+            self._accounts.pop(key, None)
+        else:
+            del self._accounts[key]
+        self.version += 1
+
+    def __iter__(self):
+        yield from list(self._accounts)
+        for target, (_, _, count) in list(self._caches.items()):
+            for index in range(count):
+                key = f'm/{index}/{target}'
+                if key not in self._accounts and key not in self._deleted:
+                    yield key
+
+    def __len__(self):
+        materialized = sum(1 for key in self._accounts if self._cached_index(key)[0] is not None)
+        return len(self._accounts) + sum(count for _, _, count in self._caches.values()) \
+            - len(self._deleted) - materialized
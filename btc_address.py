@@ -1,10 +1,21 @@
 import hashlib
+from bitcoinutils import bech32
+from bitcoinutils.constants import NETWORK_SEGWIT_PREFIXES
+from bitcoinutils.ripemd160 import ripemd160
 from bitcoinutils.setup import setup
-from bitcoinutils.keys import PublicKey, P2wpkhAddress
+from bitcoinutils.keys import PublicKey
 
 from btc_notes import generate_p2tr_note_info, generate_p2tr_commit_note_info
 from n_types import IAddressObject, AddressType, NotePayload
 
+def hash160(data):
+    digest = hashlib.sha256(data).digest()
+    try:
+        return hashlib.new('ripemd160', digest).digest()
+    except ValueError:
+        # OpenSSL builds without the legacy provider lack ripemd160
+        return ripemd160(digest)
+
 def generate_p2wpkh_address(pubkey, network):
     """
     Generate a Pay-to-Witness-Public-Key-Hash (P2WPKH) address.
@@ -18,11 +29,13 @@ def generate_p2wpkh_address(pubkey, network):
                       script, script hash, and address type.
     """
     setup(network)
-    pubkey_obj = PublicKey(pubkey)
-    address_obj = P2wpkhAddress(pubkey_obj.get_segwit_address().to_string())
-    script = address_obj.to_script_pub_key().to_hex()
-    script_hash = hashlib.sha256(bytes.fromhex(script)).digest()[::-1].hex()
-    return IAddressObject(address=address_obj.to_string(),
+    pubkey_bytes = bytes.fromhex(pubkey)
+    if len(pubkey_bytes) != 33:
+        pubkey_bytes = bytes.fromhex(PublicKey(pubkey).to_hex(compressed=True))
+    pubkey_hash = hash160(pubkey_bytes)
+    script = b'\x00\x14' + pubkey_hash
+    script_hash = hashlib.sha256(script).digest()[::-1].hex()
+    return IAddressObject(address=bech32.encode(NETWORK_SEGWIT_PREFIXES[network], 0, pubkey_hash),
                           script=script,
                           script_hash=script_hash,
                           type=AddressType.P2WPKH)
@@ -41,8 +54,8 @@ def generate_p2tr_note_address(pubkey, network):
     """
     setup(network)
     p2tr_note_info = generate_p2tr_note_info(pubkey, network)
-    script = p2tr_note_info['scriptP2TR']['output'].hex()
-    script_hash = hashlib.sha256(bytes.fromhex(script)).digest()[::-1].hex()
+    script = p2tr_note_info['scriptP2TR']['output']
+    script_hash = hashlib.sha256(script).digest()[::-1].hex()
     return IAddressObject(address=p2tr_note_info['scriptP2TR']['address'],
                           script=script,
                           script_hash=script_hash,
@@ -63,8 +76,8 @@ def generate_p2tr_commit_note_address(payload, pubkey, network):
     """
     setup(network)
     p2tr_commit_note_info = generate_p2tr_commit_note_info(payload, pubkey, network)
-    script = p2tr_commit_note_info['scriptP2TR']['output'].hex()
-    script_hash = hashlib.sha256(bytes.fromhex(script)).digest()[::-1].hex()
+    script = p2tr_commit_note_info['scriptP2TR']['output']
+    script_hash = hashlib.sha256(script).digest()[::-1].hex()
     return IAddressObject(address=p2tr_commit_note_info['scriptP2TR']['address'],
                           script=script,
                           script_hash=script_hash,
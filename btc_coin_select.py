@@ -0,0 +1,302 @@
+"""
+Coin selection for pay UTXOs.
+
+A coin selector has the signature of select_coins and returns the pay UTXOs to spend.
+select_coins tries branch-and-bound for a changeless selection first and falls back to
+knapsack and largest-first selection.
+"""
+from typing import List, Optional, Tuple
+from math import ceil
+import random
+
+from btc_vsize import pay_input_weight, p2wpkh_input_weight, output_weight, tx_vsize, fee_for_vsize, \
+    WITNESS_SCALE_FACTOR
+from n_types import IUtxo, ITokenUtxo, ISendToAddress
+from config import MIN_SATOSHIS
+
+BNB_MAX_TRIES = 100000
+KNAPSACK_ITERATIONS = 1000
+
+def input_fee(utxo: IUtxo, fee_rate: int):
+    """
+    Returns the fee in satoshis of spending the UTXO at fee_rate in satoshis per KB.
+    """
+    return ceil(pay_input_weight(utxo) * fee_rate / (1000 * WITNESS_SCALE_FACTOR))
+
+def effective_value(utxo: IUtxo, fee_rate: int):
+    return utxo.satoshis - input_fee(utxo, fee_rate)
+
+def branch_and_bound(utxos: List[IUtxo],
+                     target: int,
+                     cost_of_change: int,
+                     fee_rate: int) -> Optional[List[IUtxo]]:
+    """
+    Searches for a changeless selection whose effective value lies within
+    [target, target + cost_of_change], preferring the least excess.
+
+    Returns:
+        The selected UTXOs, or None if no such selection was found.
+    """
+    pool = sorted(((effective_value(utxo, fee_rate), utxo) for utxo in utxos),
+                  key=lambda item: item[0], reverse=True)
+    pool = [item for item in pool if item[0] > 0]
+    available = sum(value for value, _ in pool)
+    if available < target:
+        return None
+
+    selection = []
+    value = 0
+    best_selection = None
+    best_waste = None
+    index = 0
+    for _ in range(BNB_MAX_TRIES):
+        backtrack = False
+        if value + available < target or value > target + cost_of_change:
+            backtrack = True
+        elif value >= target:
+            waste = value - target
+            if best_waste is None or waste <= best_waste:
+                best_selection = list(selection)
+                best_waste = waste
+            backtrack = True
+
+        if backtrack:
+            if not selection:
+                break
+            # Put the omitted UTXOs back before trying to omit the last included one
+            index -= 1
+            while index > selection[-1]:
+                available += pool[index][0]
+                index -= 1
+            value -= pool[index][0]
+            selection.pop()
+        else:
+            utxo_value = pool[index][0]
+            available -= utxo_value
+            # Skip branches equivalent to one already explored with an omitted UTXO
+            if not selection or index - 1 == selection[-1] or utxo_value != pool[index - 1][0]:
+                selection.append(index)
+                value += utxo_value
+        index += 1
+
+    if best_selection is None:
+        return None
+    return [pool[i][1] for i in best_selection]
+
+def _approximate_best_subset(values: List[int], total_lower: int, target: int, rng):
+    best = [True] * len(values)
+    best_value = total_lower
+    for _ in range(KNAPSACK_ITERATIONS):
+        if best_value == target:
+            break
+        included = [False] * len(values)
+        total = 0
+        reached_target = False
+        for npass in range(2):
+            if reached_target:
+                break
+            for i, value in enumerate(values):
+                if (npass == 0 and rng.random() < 0.5) or (npass == 1 and not included[i]):
+                    total += value
+                    included[i] = True
+                    if total >= target:
+                        reached_target = True
+                        if total < best_value:
+                            best_value = total
+                            best = list(included)
+                        total -= value
+                        included[i] = False
+    return best, best_value
+
+def knapsack(utxos: List[IUtxo],
+             target: int,
+             cost_of_change: int,
+             fee_rate: int) -> Optional[List[IUtxo]]:
+    """
+    Stochastic approximation of the smallest selection reaching the target, or the
+    target plus a spendable change output.
+
+    Returns:
+        The selected UTXOs, or None if the UTXOs cannot reach the target.
+    """
+    min_change = cost_of_change + MIN_SATOSHIS
+    applicable = []
+    total_lower = 0
+    lowest_larger = None
+    for utxo in utxos:
+        value = effective_value(utxo, fee_rate)
+        if value <= 0:
+            continue
+        if value == target:
+            return [utxo]
+        if value < target + min_change:
+            applicable.append((value, utxo))
+            total_lower += value
+        elif lowest_larger is None or value < lowest_larger[0]:
+            lowest_larger = (value, utxo)
+
+    if total_lower == target:
+        return [utxo for _, utxo in applicable]
+    if total_lower < target:
+        return [lowest_larger[1]] if lowest_larger else None
+
+    applicable.sort(key=lambda item: item[0], reverse=True)
+    values = [value for value, _ in applicable]
+    rng = random.Random()
+    best, best_value = _approximate_best_subset(values, total_lower, target, rng)
+    if best_value != target and total_lower >= target + min_change:
+        best, best_value = _approximate_best_subset(values, total_lower, target + min_change, rng)
+
+    if lowest_larger and \
+            ((best_value != target and best_value < target + min_change) or lowest_larger[0] <= best_value):
+        return [lowest_larger[1]]
+    return [utxo for included, (_, utxo) in zip(best, applicable) if included]
+
+def largest_first(utxos: List[IUtxo],
+                  target: int,
+                  cost_of_change: int,
+                  fee_rate: int) -> Optional[List[IUtxo]]:
+    """
+    Spends the UTXOs with the largest effective value until the target is reached.
+
+    Returns:
+        The selected UTXOs, or None if the UTXOs cannot reach the target.
+    """
+    selection = []
+    value = 0
+    for utxo in sorted(utxos, key=lambda utxo: effective_value(utxo, fee_rate), reverse=True):
+        if value >= target:
+            break
+        utxo_value = effective_value(utxo, fee_rate)
+        if utxo_value <= 0:
+            break
+        selection.append(utxo)
+        value += utxo_value
+    return selection if value >= target else None
+
+def select_coins(utxos: List[IUtxo],
+                 target: int,
+                 fee_rate: int,
+                 fixed_input_weights: List[int],
+                 output_weights: List[int],
+                 change_weight: int,
+                 required: List[IUtxo] = None,
+                 algorithms=(branch_and_bound, knapsack, largest_first)) -> List[IUtxo]:
+    """
+    Selects the pay UTXOs needed to fund a transaction.
+
+    Args:
+        utxos (List[IUtxo]): The candidate pay UTXOs.
+        target (int): The satoshis the pay UTXOs must add, before fees.
+        fee_rate (int): The fee rate in satoshis per KB.
+        fixed_input_weights (List[int]): The weights of inputs that are always spent.
+        output_weights (List[int]): The weights of the outputs, without change.
+        change_weight (int): The weight of the change output.
+        required (List[IUtxo], optional): Pay UTXOs that must be spent.
+        algorithms (optional): The selection algorithms, tried in order.
+
+    Returns:
+        The selected pay UTXOs, starting with the required ones. All UTXOs are
+        returned if no algorithm can fund the transaction.
+    """
+    required = required or []
+    required_ids = {id(utxo) for utxo in required}
+    candidates = [utxo for utxo in utxos if id(utxo) not in required_ids]
+    required_weights = [pay_input_weight(utxo) for utxo in required]
+    not_input_fee = fee_for_vsize(tx_vsize(fixed_input_weights + required_weights, output_weights),
+                                  fee_rate)
+    selection_target = target + not_input_fee - sum(utxo.satoshis for utxo in required)
+    if selection_target <= 0:
+        return list(required)
+
+    # Creating a change output now and spending it later
+    cost_of_change = ceil((change_weight + p2wpkh_input_weight()) * fee_rate /
+                          (1000 * WITNESS_SCALE_FACTOR))
+
+    for algorithm in algorithms:
+        selection = algorithm(candidates, selection_target, cost_of_change, fee_rate)
+        if selection is None:
+            continue
+        selection = list(required) + selection
+        input_weights = fixed_input_weights + [pay_input_weight(utxo) for utxo in selection]
+        fee = fee_for_vsize(tx_vsize(input_weights, output_weights), fee_rate)
+        if sum(utxo.satoshis for utxo in selection) >= target + fee:
+            return selection
+    return list(utxos)
+
+def settle_fee(available: int, fee_with_change: int, fee_without_change: int):
+    """
+    Returns the fee of a transaction with `available` satoshis left after its outputs.
+
+    A leftover too small for a change output is given to the miners.
+    """
+    if available - fee_with_change > MIN_SATOSHIS:
+        return fee_with_change
+    if available >= fee_without_change:
+        return available
+    return fee_without_change
+
+def select_pay_utxos(pay_utxos: List[IUtxo],
+                     fixed_input_weights: List[int],
+                     fixed_input_value: int,
+                     to_addresses: List[ISendToAddress],
+                     change: str,
+                     fee_rate: int,
+                     coin_selector=select_coins) -> Tuple[List[IUtxo], int]:
+    """
+    Selects the pay UTXOs of a transaction and computes its fee.
+
+    Token UTXOs among the pay UTXOs carry token balance and are always spent.
+
+    Args:
+        pay_utxos (List[IUtxo]): The candidate pay UTXOs.
+        fixed_input_weights (List[int]): The weights of the inputs spent before the pay UTXOs.
+        fixed_input_value (int): The satoshis of those inputs.
+        to_addresses (List[ISendToAddress]): The outputs, without change.
+        change (str): The change address.
+        fee_rate (int): The fee rate in satoshis per KB.
+        coin_selector (optional): The coin selector, None spends every pay UTXO.
+
+    Returns:
+        A tuple of the selected pay UTXOs and the fee in satoshis.
+    """
+    output_weights = [output_weight(to.address) for to in to_addresses]
+    change_weight = output_weight(change)
+    total_output = sum(to.amount for to in to_addresses)
+
+    if coin_selector is None:
+        selection = list(pay_utxos)
+    else:
+        required = [utxo for utxo in pay_utxos if isinstance(utxo, ITokenUtxo)]
+        selection = coin_selector(pay_utxos,
+                                  total_output - fixed_input_value,
+                                  fee_rate,
+                                  fixed_input_weights,
+                                  output_weights,
+                                  change_weight,
+                                  required)
+
+    input_weights = fixed_input_weights + [pay_input_weight(utxo) for utxo in selection]
+    available = fixed_input_value + sum(utxo.satoshis for utxo in selection) - total_output
+    fee = settle_fee(available,
+                     fee_for_vsize(tx_vsize(input_weights, output_weights + [change_weight]), fee_rate),
+                     fee_for_vsize(tx_vsize(input_weights, output_weights), fee_rate))
+    return selection, fee
+
+def spent_utxos(tx, utxos: List[IUtxo]) -> List[IUtxo]:
+    """
+    Returns the UTXOs spent by the transaction, in input order.
+    """
+    by_outpoint = {(bytes.fromhex(utxo.tx_id), utxo.output_index): utxo for utxo in utxos}
+    spent = []
+    for tx_in in tx.vin:
+        utxo = by_outpoint.get((tx_in.prev_out.tx_id, tx_in.prev_out.vout))
+        if utxo is not None:
+            spent.append(utxo)
+    return spent
+
+def paid_fee(tx, spent: List[IUtxo]) -> int:
+    """
+    Returns the fee paid by the transaction spending the given UTXOs.
+    """
+    return sum(utxo.satoshis for utxo in spent) - sum(tx_out.value for tx_out in tx.vout)
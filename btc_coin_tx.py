@@ -7,7 +7,10 @@ from btclib.script import ScriptPubKey, witness
 from bitcoinutils.setup import setup
 from bitcoinutils.keys import PrivateKey
 
-from btc_psbt import add_psbt_pay_utxos, sign_psbt_input
+from btc_coin_select import select_coins, select_pay_utxos
+from btc_vsize import estimate_coin_tx_vsize, fee_for_vsize
+from btc_psbt import add_psbt_pay_utxos, sign_psbt_input, TaprootSighashCache, SegwitV0SighashCache
+from btc_raw_tx import pay_utxo_inputs, build_raw_tx
 from n_types import IUtxo, ISendToAddress, AddressType
 from config import MIN_SATOSHIS
 
@@ -18,7 +21,9 @@ def create_coin_psbt(private_key: PrivateKey,
                      change: str,
                      network: str,
                      fee_rate: int,
-                     fee: int = 1000):
+                     fee: int = None,
+                     coin_selector=select_coins,
+                     raw: bool = False):
     """
     Creates a Partially Signed Bitcoin Transaction (PSBT) for minting/sending coins.
 
@@ -28,22 +33,39 @@ def create_coin_psbt(private_key: PrivateKey,
         to (List[ISendToAddress]): The list of addresses and amounts to send coins to.
         change (str): The address to receive the change (if any).
         network (str): The network to use (e.g., 'mainnet', 'testnet').
-        fee_rate (int): The fee rate in satoshis per byte.
-        fee (int, optional): The transaction fee in satoshis. Defaults to 1000.
+        fee_rate (int): The fee rate in satoshis per KB.
+        fee (int, optional): The transaction fee in satoshis. If None, the UTXOs to spend
+                             are chosen by coin_selector and the fee is estimated from
+                             fee_rate. Defaults to None.
+        coin_selector (optional): The coin selector, None spends every UTXO.
+                                  Defaults to select_coins.
+        raw (bool, optional): Sign and serialize the transaction directly instead of
+                              through a PSBT. Defaults to False.
 
     Returns:
-        The transaction in Tx format of btclib.
+        The transaction in Tx format of btclib, or a RawTransaction if raw is set.
 
     Raises:
         Exception: If there are insufficient funds or no change address is provided.
     """
+    if fee is None:
+        if len(to) == 1 and to[0].amount == sum(utxo.satoshis for utxo in utxos):
+            # Sweep every UTXO to the single receiver
+            fee = fee_for_vsize(estimate_coin_tx_vsize(utxos, to, change), fee_rate)
+        else:
+            utxos, fee = select_pay_utxos(utxos, [], 0, to, change, fee_rate, coin_selector)
+
     # Add UTXOs
     tx_out = []
     tx_in = []
     psbt_in = []
     psbt_out = []
 
-    total_input = add_psbt_pay_utxos(private_key, psbt_in, tx_in, utxos, network)
+    if raw:
+        inputs = pay_utxo_inputs(private_key, utxos, network)
+        total_input = sum(raw_input.prevout.value for raw_input in inputs)
+    else:
+        total_input = add_psbt_pay_utxos(private_key, psbt_in, tx_in, utxos, network)
 
     if len(to) == 1 and to[0].amount == total_input:
         value = int(total_input - fee)
@@ -65,6 +87,8 @@ def create_coin_psbt(private_key: PrivateKey,
             psbt_out.append(PsbtOut())
             tx_out.append(TxOut(value, ScriptPubKey.from_address(change)))
 
+    if raw:
+        return build_raw_tx(inputs, tx_out)
 
     psbt = Psbt(tx=Tx(version=2, lock_time=0, vin=tx_in, vout=tx_out),
                 inputs=psbt_in,
@@ -73,12 +97,16 @@ def create_coin_psbt(private_key: PrivateKey,
                 version=0)
 
     # Sign inputs
+    taproot_cache = TaprootSighashCache.from_psbt(psbt)
+    segwit_v0_cache = SegwitV0SighashCache(psbt.tx)
     for i in range(len(psbt.inputs)):
         utxo = utxos[i]
         sign_psbt_input(
             PrivateKey.from_wif(utxo.private_key_wif) if utxo.private_key_wif else private_key,
             psbt,
-            i)
+            i,
+            taproot_cache,
+            segwit_v0_cache)
 
     for psbt_input in psbt.inputs:
         if psbt_input.partial_sigs != {}:
@@ -0,0 +1,194 @@
+"""
+Fee rate oracle of the BTC wallet.
+
+Fee rates are fetched from the first source that answers and cached for `ttl`
+seconds. Past that, the cached rates are still served for up to `maxStale`
+seconds while a background refresh fetches new ones, so building a transaction
+does not wait on a fee request once the oracle is warm. The options are read from
+CoinConfig.fees:
+
+    sources     source names tried in order: mempool, urchain, file
+    ttl         seconds fetched rates are fresh
+    maxStale    seconds stale rates are served while revalidating
+    mempoolUrl  mempool.space API root of the network
+    urchainCommand  Urchain command returning fee rates, for deployments exposing one
+    file        JSON file of fee rates for offline runs
+    timeout     request timeout in seconds
+
+Rates are returned in satoshis per kB as IFees-shaped dicts.
+"""
+import json
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_FEE_TTL = 60
+DEFAULT_FEE_MAX_STALE = 1800
+DEFAULT_FEE_TIMEOUT = 10
+DEFAULT_FEE_SOURCES = ('mempool',)
+DEFAULT_MEMPOOL_URL = 'https://mempool.space/api'
+DEFAULT_MEMPOOL_URL_TESTNET = 'https://mempool.space/testnet4/api'
+
+
+def fees_per_kb(fees):
+    """
+    Converts mempool.space recommended fees (sat/vB) to slow, average and fast
+    fee rates in sat/kB. Rates already in sat/kB are returned as is.
+    """
+    if 'avgFee' in fees:
+        return {
+            "slowFee": fees['slowFee'],
+            "avgFee": fees['avgFee'],
+            "fastFee": fees['fastFee']
+        }
+    return {
+        "slowFee": min(fees['hourFee'], fees['halfHourFee']) * 1000,
+        "avgFee": max(fees['hourFee'], fees['halfHourFee']) * 1000,
+        "fastFee": max(fees['hourFee'], fees['halfHourFee'], fees['fastestFee']) * 1000
+    }
+
+
+class MempoolFeeSource:
+    """
+    Recommended fees of a mempool.space API, fetched over a pooled session.
+    """
+    name = 'mempool'
+
+    def __init__(self, url, session=None, timeout=DEFAULT_FEE_TIMEOUT):
+        self.url = url.rstrip('/') + '/v1/fees/recommended'
+        self.timeout = timeout
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=2)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+        self.session = session
+
+    def __call__(self):
+        response = self.session.get(self.url, timeout=self.timeout)
+        if response.status_code != 200:
+            raise Exception(f"Cannot get fee rate, status code: {response.status_code} url: {self.url}")
+        return fees_per_kb(response.json())
+
+
+class UrchainFeeSource:
+    """
+    Fee rates served by Urchain, in either mempool.space or IFees format.
+    """
+    name = 'urchain'
+
+    def __init__(self, urchain, command):
+        self.urchain = urchain
+        self.command = command
+
+    def __call__(self):
+        return fees_per_kb(self.urchain.fee_rates(self.command))
+
+
+class StaticFeeSource:
+    """
+    Fee rates read from a JSON file, in either mempool.space or IFees format.
+    """
+    name = 'file'
+
+    def __init__(self, path):
+        self.path = path
+
+    def __call__(self):
+        with open(self.path) as file:
+            return fees_per_kb(json.load(file))
+
+
+class FeeOracle:
+    """
+    Args:
+        sources (list): Callables returning IFees-shaped dicts, tried in order.
+        ttl (float, optional): Seconds fetched rates are fresh.
+        max_stale (float, optional): Seconds stale rates are served while a
+            background refresh runs.
+    """
+    def __init__(self, sources, ttl=DEFAULT_FEE_TTL, max_stale=DEFAULT_FEE_MAX_STALE, clock=time.monotonic):
+        if not sources:
+            raise ValueError("No fee source configured")
+        self.sources = list(sources)
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._fees = None
+        self._fetched_at = 0.0
+        self._refreshing = None
+
+    def cached(self):
+        """
+        Returns True if get() can be served without waiting on a source.
+        """
+        with self._lock:
+            return self._fees is not None and self._clock() - self._fetched_at < self.ttl + self.max_stale
+
+    def get(self):
+        """
+        Returns the fee rates, only blocking when none or too stale ones are cached.
+        """
+        with self._lock:
+            fees, age = self._fees, self._clock() - self._fetched_at
+        if fees is not None and age < self.ttl:
+            return fees
+        if fees is not None and age < self.ttl + self.max_stale:
+            self.prefetch()
+            return fees
+        return self.refresh()
+
+    def refresh(self):
+        """
+        Fetches the rates from the first source that answers.
+        """
+        error = None
+        for source in self.sources:
+            try:
+                fees = source()
+            except Exception as err:
+                error = err
+                continue
+            with self._lock:
+                self._fees = fees
+                self._fetched_at = self._clock()
+            return fees
+        raise error
+
+    def prefetch(self):
+        """
+        Refreshes the rates in a background thread, unless a refresh is running.
+        """
+        with self._lock:
+            if self._refreshing is not None and self._refreshing.is_alive():
+                return
+            self._refreshing = threading.Thread(target=self._background_refresh, daemon=True)
+            self._refreshing.start()
+
+    def _background_refresh(self):
+        try:
+            self.refresh()
+        except Exception as err:
+            print(f'Fee rate refresh failed: {err}')
+
+
+def build_fee_oracle(options, urchain=None, testnet=False):
+    """
+    Builds the fee oracle described by CoinConfig.fees.
+    """
+    timeout = options.get('timeout', DEFAULT_FEE_TIMEOUT)
+    mempool_url = options.get('mempoolUrl') or (DEFAULT_MEMPOOL_URL_TESTNET if testnet else DEFAULT_MEMPOOL_URL)
+    sources = []
+    for name in options.get('sources', DEFAULT_FEE_SOURCES):
+        if name == 'mempool':
+            sources.append(MempoolFeeSource(mempool_url, timeout=timeout))
+        elif name == 'urchain' and urchain is not None and options.get('urchainCommand'):
+            sources.append(UrchainFeeSource(urchain, options['urchainCommand']))
+        elif name == 'file' and options.get('file'):
+            sources.append(StaticFeeSource(options['file']))
+    return FeeOracle(sources,
+                     options.get('ttl', DEFAULT_FEE_TTL),
+                     options.get('maxStale', DEFAULT_FEE_MAX_STALE))
@@ -0,0 +1,243 @@
+from typing import List, Optional
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import hashlib
+import multiprocessing
+
+from btclib import var_int
+from btclib.script import witness
+from btclib.script.script_pub_key import is_p2wpkh
+from btclib.script.sig_hash import from_tx
+
+from bitcoinutils.setup import setup
+from bitcoinutils.keys import PrivateKey
+from bitcoinutils.constants import SIGHASH_ALL
+
+from bitcointx.core.key import CKey
+
+from btc_p2tr_note import build_p2tr_note_psbt
+from btc_psbt import hash_for_witness_v1, hash_for_witness_v0, p2wpkh_script_code, tapleaf_hash, \
+    TaprootSighashCache, SegwitV0SighashCache
+from notes import compile_bitwork
+from n_types import NotePayload, IUtxo, ISendToAddress, ITransaction
+
+
+class MintEngine:
+    """
+    Incremental locktime grinder for P2TR NOTE payload transactions.
+
+    The transaction template (inputs, outputs and fee) is built once. Every nonce
+    only patches nLockTime, re-signs the inputs from the cached prevouts, keys and
+    tapleaf hashes and BIP341/BIP143 sighash midstates, and re-serializes the
+    witness transaction.
+
+    Everything before the first witness (version, marker, inputs and outputs) is
+    identical for every nonce, so the SHA-256 state after that prefix is kept and
+    only the witnesses and locktime are hashed per nonce.
+    """
+    def __init__(self,
+                 private_key: PrivateKey,
+                 note_payload: NotePayload,
+                 note_utxos: List[IUtxo],
+                 pay_utxos: List[IUtxo],
+                 to_addresses: List[ISendToAddress],
+                 change: str,
+                 network: str,
+                 fee: int,
+                 fee_rate=None):
+        self.note_utxos = note_utxos
+        self.pay_utxos = pay_utxos
+        self.network = network
+        self.fee = fee
+        self.fee_rate = fee_rate
+        self._args = (private_key, note_payload, note_utxos, pay_utxos,
+                      to_addresses, change, network, fee, fee_rate)
+
+        psbt, _ = build_p2tr_note_psbt(private_key,
+                                       note_payload,
+                                       note_utxos,
+                                       pay_utxos,
+                                       to_addresses,
+                                       change,
+                                       network,
+                                       fee)
+        self.tx = psbt.tx
+        self._prevouts = [psbt_input.witness_utxo for psbt_input in psbt.inputs]
+        self._prev_out_scripts = [prevout.script_pub_key.script for prevout in self._prevouts]
+        self._values = [prevout.value for prevout in self._prevouts]
+        # Inputs and outputs are fixed, so the sighash midstates are shared by all nonces
+        self._taproot_cache = TaprootSighashCache(self.tx, self._prev_out_scripts, self._values)
+        self._segwit_v0_cache = SegwitV0SighashCache(self.tx)
+        self._script_codes = [p2wpkh_script_code(script) if is_p2wpkh(script) else None
+                              for script in self._prev_out_scripts]
+
+        self._keys = []
+        self._leaf_hashes = []
+        self._witness_tails = []
+        for i, utxo in enumerate(list(note_utxos) + list(pay_utxos)):
+            if utxo.private_key_wif is not None:
+                privkey = PrivateKey(utxo.private_key_wif)
+            else:
+                privkey = private_key
+            key = CKey(privkey.to_bytes())
+            self._keys.append(key)
+
+            taproot_leaf_scripts = psbt.inputs[i].taproot_leaf_scripts
+            if taproot_leaf_scripts != {}:
+                self._leaf_hashes.append(tapleaf_hash(taproot_leaf_scripts))
+                control_block = list(taproot_leaf_scripts.keys())[0]
+                leaf_script = list(taproot_leaf_scripts.values())[0][0]
+                if i == 0:
+                    # The first note input reveals the payload through the note script
+                    self._witness_tails.append([
+                        *note_payload.segments(),
+                        leaf_script,
+                        control_block])
+                else:
+                    self._witness_tails.append([leaf_script, control_block])
+            else:
+                self._leaf_hashes.append(None)
+                self._witness_tails.append([bytes(key.pub)])
+
+        self._prefix = b"".join([
+            self.tx.version.to_bytes(4, byteorder="little", signed=False),
+            b"\x00\x01",
+            var_int.serialize(len(self.tx.vin)),
+            b"".join(tx_in.serialize(False) for tx_in in self.tx.vin),
+            var_int.serialize(len(self.tx.vout)),
+            b"".join(tx_out.serialize(False) for tx_out in self.tx.vout),
+        ])
+        self._prefix_sha256 = hashlib.sha256(self._prefix)
+
+    def __reduce__(self):
+        # Rebuild the template from its inputs, ctypes keys cannot be pickled
+        return (MintEngine, self._args)
+
+    def sign(self, locktime: int):
+        """
+        Patches nLockTime of the template and re-signs every input.
+        """
+        self.tx.lock_time = locktime
+        for i, key in enumerate(self._keys):
+            leaf_hash = self._leaf_hashes[i]
+            if leaf_hash is not None:
+                hash_for_sig = hash_for_witness_v1(self.tx, i, self._prev_out_scripts,
+                                                   self._values, 0, leaf_hash, None,
+                                                   self._taproot_cache)
+                signature = key.sign_schnorr_no_tweak(hash_for_sig)
+            else:
+                if self._script_codes[i] is not None:
+                    hash_for_sig = hash_for_witness_v0(self.tx, i, self._script_codes[i],
+                                                       self._values[i], SIGHASH_ALL,
+                                                       self._segwit_v0_cache)
+                else:
+                    hash_for_sig = from_tx(self._prevouts, self.tx, i, SIGHASH_ALL)
+                signature = key.sign(hash_for_sig) + bytes([SIGHASH_ALL])
+            self.tx.vin[i].script_witness = witness.Witness([signature] + self._witness_tails[i])
+
+    def _serialize_tail(self):
+        return b"".join(
+            [tx_in.script_witness.serialize(False) for tx_in in self.tx.vin] +
+            [self.tx.lock_time.to_bytes(4, byteorder="little", signed=False)])
+
+    def hash256(self, locktime: int) -> bytes:
+        """
+        Signs the template for the given locktime and returns the raw hash256
+        digest of the witness-serialized transaction.
+        """
+        self.sign(locktime)
+        sha = self._prefix_sha256.copy()
+        sha.update(self._serialize_tail())
+        return hashlib.sha256(sha.digest()).digest()
+
+    def transaction(self) -> ITransaction:
+        """
+        Returns the transaction as last signed.
+        """
+        return ITransaction(
+            tx_id=self.tx.id,
+            tx_hex=self._prefix + self._serialize_tail(),
+            note_utxo=self.note_utxos[0],
+            note_utxos=self.note_utxos,
+            pay_utxos=self.pay_utxos,
+            fee_rate=self.fee_rate,
+            fee=self.fee
+        )
+
+    def build(self, locktime: int) -> ITransaction:
+        """
+        Builds the signed transaction for the given locktime.
+        """
+        self.sign(locktime)
+        return self.transaction()
+
+
+_worker_engine = None
+_worker_stop = None
+
+def _init_mine_worker(engine: MintEngine, stop_event):
+    global _worker_engine, _worker_stop
+    setup(engine.network)
+    _worker_engine = engine
+    _worker_stop = stop_event
+
+def _mine_range(start: int, end: int, bitwork: str) -> Optional[int]:
+    matches = compile_bitwork(bitwork)
+    for locktime in range(start, end):
+        if _worker_stop.is_set():
+            return None
+        if matches(_worker_engine.hash256(locktime)):
+            return locktime
+    return None
+
+def mine_locktime(engine: MintEngine,
+                  bitwork: str,
+                  start: int,
+                  end: int,
+                  workers: int,
+                  chunk_size: int = 10000,
+                  progress=None) -> Optional[int]:
+    """
+    Searches [start, end) for a locktime whose tx hash matches the bitwork prefix.
+
+    The range is split into disjoint chunks that are ground by a pool of worker
+    processes, each holding its own copy of the engine. The first worker to find
+    a match stops the others.
+
+    Args:
+        engine (MintEngine): The engine holding the transaction template.
+        bitwork (str): The hex prefix the hash256 of the transaction must start with.
+        start (int): The first locktime to try.
+        end (int): The locktime to stop before.
+        workers (int): The number of worker processes.
+        chunk_size (int, optional): The number of locktimes per task. Defaults to 10000.
+        progress (callable, optional): Called with the number of locktimes searched so far.
+
+    Returns:
+        The matching locktime, or None if the range is exhausted.
+    """
+    ctx = multiprocessing.get_context()
+    stop_event = ctx.Event()
+    searched = 0
+    with ProcessPoolExecutor(max_workers=workers,
+                             mp_context=ctx,
+                             initializer=_init_mine_worker,
+                             initargs=(engine, stop_event)) as executor:
+        pending = {
+            executor.submit(_mine_range, i, min(i + chunk_size, end), bitwork): min(chunk_size, end - i)
+            for i in range(start, end, chunk_size)
+        }
+        try:
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    searched += pending.pop(future)
+                    locktime = future.result()
+                    if locktime is not None:
+                        return locktime
+                if progress:
+                    progress(searched)
+        finally:
+            stop_event.set()
+            for future in pending:
+                future.cancel()
+    return None
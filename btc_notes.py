@@ -1,28 +1,93 @@
+from collections import OrderedDict
+from functools import lru_cache
+from types import MappingProxyType
+import hashlib
+
 from bitcointx import select_chain_params
 from bitcointx.wallet import P2TRBitcoinTestnetAddress, TaprootScriptTree, P2TRBitcoinAddress
 from bitcointx.core.key import XOnlyPubKey
-from bitcointx.core import x
 from bitcointx.core.script import OP_CHECKSIG, CScript
 from notes import build_note_script, build_commit_note_script
 from utils import to_x_only
 from n_types import NotePayload
 
-
-def generate_p2tr_note_info(pubkey:str, network='mainnet'):
+# Number of (pubkey, network) note trees kept by generate_p2tr_note_info
+NOTE_INFO_CACHE_SIZE = 256
+# Bounds of the commit note trees kept by generate_p2tr_commit_note_info
+COMMIT_NOTE_INFO_CACHE_ENTRIES = 64
+COMMIT_NOTE_INFO_CACHE_BYTES = 1024 * 1024
+# Control blocks, address and output script of a cached tree, besides its leaf scripts
+TREE_INFO_OVERHEAD_SIZE = 256
+
+
+class BoundedCache:
+    """
+    Least recently used cache bounded by entry count and by the total byte size
+    of its values.
+    """
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, value, size: int):
+        """
+        Stores the value, evicting the least recently used entries to stay within
+        the bounds. Values larger than max_bytes are not stored.
+        """
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self.size -= self._entries.pop(key)[1]
+        self._entries[key] = (value, size)
+        self.size += size
+        while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self.size -= evicted_size
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+
+_commit_note_info_cache = BoundedCache(COMMIT_NOTE_INFO_CACHE_ENTRIES, COMMIT_NOTE_INFO_CACHE_BYTES)
+
+
+def _freeze(value):
+    """
+    Returns a read-only copy of nested dicts and lists, so cached results can be shared.
+    """
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+def _p2tr_tree_info(leaf_script: CScript, x_only_pubkey: bytes, network: str):
+    """
+    Builds the two-leaf taproot tree of leaf_script and the p2pk script of the key.
+    """
     if network == 'testnet':
         select_chain_params('bitcoin/testnet')
     else:
         select_chain_params('bitcoin')
 
-    x_only_pubkey = to_x_only(bytes.fromhex(pubkey))
-
-    note_script = build_note_script(x_only_pubkey.hex())
-    p2pk_script = CScript([x(x_only_pubkey.hex()), OP_CHECKSIG], name='p2pk_script')
+    p2pk_script = CScript([x_only_pubkey, OP_CHECKSIG], name='p2pk_script')
 
     obj_pubkey = XOnlyPubKey(x_only_pubkey)
-    root_tree = TaprootScriptTree([note_script, p2pk_script],
-                                   leaf_version=192,
-                                   internal_pubkey=obj_pubkey)
+    root_tree = TaprootScriptTree([leaf_script, p2pk_script],
+                                  leaf_version=192,
+                                  internal_pubkey=obj_pubkey)
 
     if network == 'testnet':
         p2tr = P2TRBitcoinTestnetAddress.from_script_tree(stree=root_tree)
@@ -34,17 +99,17 @@ def generate_p2tr_note_info(pubkey:str, network='mainnet'):
     p2pk_p2tr = {}
 
     note_redeem = {
-        'output': bytes.fromhex((root_tree.get_script('note_script').hex())),
+        'output': bytes(root_tree.get_script(leaf_script.name)),
         'redeemVersion': 192
     }
 
     p2pk_redeem = {
-        'output': bytes.fromhex(root_tree.get_script('p2pk_script').hex()),
+        'output': bytes(root_tree.get_script('p2pk_script')),
         'redeemVersion': 192
     }
 
     script_p2tr['address'] = p2pk_p2tr['address'] = note_p2tr['address'] = str(p2tr)
-    script_p2tr['output'] = note_p2tr['output']= p2pk_p2tr['output'] = bytes.fromhex(p2tr.to_scriptPubKey().hex())
+    script_p2tr['output'] = note_p2tr['output']= p2pk_p2tr['output'] = bytes(p2tr.to_scriptPubKey())
     script_p2tr['redeemVersion'] = note_p2tr['redeemVersion'] = p2pk_p2tr['redeemVersion'] = 192
     script_p2tr['scriptTree'] = note_p2tr['scriptTree'] = p2pk_p2tr['scriptTree'] = [{'output': note_redeem['output']}, {'output': p2pk_redeem['output']}]
     script_p2tr['signature'] = note_p2tr['signature'] = p2pk_p2tr['signature']  = None
@@ -52,10 +117,10 @@ def generate_p2tr_note_info(pubkey:str, network='mainnet'):
     script_p2tr['witness'] = None
 
     note_p2tr['redeem'] = note_redeem
-    note_p2tr['witness'] = bytes.fromhex(root_tree.get_script_with_control_block('note_script')[-1].hex())
+    note_p2tr['witness'] = bytes(root_tree.get_script_with_control_block(leaf_script.name)[-1])
 
     p2pk_p2tr['redeem'] = p2pk_redeem
-    p2pk_p2tr['witness'] = bytes.fromhex(root_tree.get_script_with_control_block('p2pk_script')[-1].hex())
+    p2pk_p2tr['witness'] = bytes(root_tree.get_script_with_control_block('p2pk_script')[-1])
 
     return {
         'scriptP2TR': script_p2tr,
@@ -65,56 +130,45 @@ def generate_p2tr_note_info(pubkey:str, network='mainnet'):
         'p2pkRedeem': p2pk_redeem
     }
 
-def generate_p2tr_commit_note_info(payload:NotePayload, pubkey:str, network='mainnet'):
-    if network == 'testnet':
-        select_chain_params('bitcoin/testnet')
-    else:
-        select_chain_params('bitcoin')
-
+@lru_cache(maxsize=NOTE_INFO_CACHE_SIZE)
+def _cached_p2tr_note_info(pubkey: str, network: str):
     x_only_pubkey = to_x_only(bytes.fromhex(pubkey))
+    note_script = build_note_script(x_only_pubkey)
+    return _freeze(_p2tr_tree_info(note_script, x_only_pubkey, network))
 
-    commit_note_script = build_commit_note_script(payload, x_only_pubkey.hex())
-    p2pk_script = CScript([x(x_only_pubkey.hex()), OP_CHECKSIG], name='p2pk_script')
-
-    obj_pubkey = XOnlyPubKey(x_only_pubkey)
-    root_tree = TaprootScriptTree([commit_note_script, p2pk_script],
-                                  leaf_version=192, internal_pubkey=obj_pubkey)
-
-    if network == 'testnet':
-        p2tr = P2TRBitcoinTestnetAddress.from_script_tree(stree=root_tree)
-    else:
-        p2tr = P2TRBitcoinAddress.from_script_tree(stree=root_tree)
-
-    script_p2tr = {}
-    note_p2tr = {}
-    p2pk_p2tr = {}
-
-    note_redeem = {
-        'output': bytes.fromhex((root_tree.get_script('commit_note_script').hex())),
-        'redeemVersion': 192
-    }
-
-    p2pk_redeem = {
-        'output': bytes.fromhex(root_tree.get_script('p2pk_script').hex()),
-        'redeemVersion': 192
-    }
-
-    script_p2tr['address'] = p2pk_p2tr['address'] = note_p2tr['address'] = str(p2tr)
-    script_p2tr['output'] = note_p2tr['output']= p2pk_p2tr['output'] = bytes.fromhex(p2tr.to_scriptPubKey().hex())
-    script_p2tr['redeemVersion'] = note_p2tr['redeemVersion'] = p2pk_p2tr['redeemVersion'] = 192
-    script_p2tr['scriptTree'] = note_p2tr['scriptTree'] = p2pk_p2tr['scriptTree'] = [{'output': note_redeem['output']}, {'output': p2pk_redeem['output']}]
-    script_p2tr['signature'] = note_p2tr['signature'] = p2pk_p2tr['signature']  = None
-    script_p2tr['redeem'] = None
-    script_p2tr['witness'] = None
-
-    note_p2tr['redeem'] = note_redeem
-    note_p2tr['witness'] = bytes.fromhex(root_tree.get_script_with_control_block('commit_note_script')[-1].hex())
-
-    p2pk_p2tr['redeem'] = p2pk_redeem
-    p2pk_p2tr['witness'] = bytes.fromhex(root_tree.get_script_with_control_block('p2pk_script')[-1].hex())
+def generate_p2tr_note_info(pubkey:str, network='mainnet'):
+    """
+    Returns the taproot note tree info of the public key.
+
+    The info only depends on (pubkey, network), so it is computed once per key and
+    shared by later calls. The returned mappings and sequences are read-only.
+    """
+    return _cached_p2tr_note_info(pubkey, 'testnet' if network == 'testnet' else 'mainnet')
+
+def payload_digest(payload: NotePayload) -> bytes:
+    """
+    Returns the SHA-256 digest of the data segments of the payload.
+    """
+    digest = hashlib.sha256()
+    for segment in payload.segments():
+        digest.update(len(segment).to_bytes(4, 'little'))
+        digest.update(segment)
+    return digest.digest()
 
-    return {'scriptP2TR': script_p2tr,
-            'noteP2TR': note_p2tr,
-            'p2pkP2TR': p2pk_p2tr,
-            'noteRedeem': note_redeem,
-            'p2pkRedeem': p2pk_redeem}
+def generate_p2tr_commit_note_info(payload:NotePayload, pubkey:str, network='mainnet'):
+    """
+    Returns the taproot commit note tree info of the payload and public key.
+
+    The info is cached by payload digest, pubkey and network, so the commit note
+    script and tree are built once per payload. The returned mappings and
+    sequences are read-only.
+    """
+    network = 'testnet' if network == 'testnet' else 'mainnet'
+    key = (payload_digest(payload), pubkey.lower(), network)
+    info = _commit_note_info_cache.get(key)
+    if info is None:
+        x_only_pubkey = to_x_only(bytes.fromhex(pubkey))
+        commit_note_script = build_commit_note_script(payload, x_only_pubkey)
+        info = _freeze(_p2tr_tree_info(commit_note_script, x_only_pubkey, network))
+        _commit_note_info_cache.put(key, info, len(commit_note_script) + TREE_INFO_OVERHEAD_SIZE)
+    return info
@@ -6,8 +6,11 @@ from btclib.script import ScriptPubKey, witness
 
 from bitcoinutils.keys import PrivateKey
 
-from btc_psbt import sign_psbt_input, add_psbt_pay_utxos
+from btc_psbt import sign_psbt_input, add_psbt_pay_utxos, TaprootSighashCache, SegwitV0SighashCache
 from btc_notes import generate_p2tr_commit_note_info
+from btc_coin_select import select_coins, select_pay_utxos
+from btc_vsize import commit_note_input_weight
+from btc_raw_tx import utxo_input, pay_utxo_inputs, build_raw_tx
 
 from config import MIN_SATOSHIS
 from constants import MAX_SEQUENCE
@@ -23,12 +26,33 @@ def create_p2tr_commit_note_psbt(
         change: str,
         network: str,
         fee_rate: int,
-        fee: int = 1000
+        fee: int = None,
+        coin_selector=select_coins,
+        raw: bool = False
         ):
+    """
+    Creates the signed P2TR COMMIT NOTE transaction.
+
+    If fee is None, the pay UTXOs to spend are chosen by coin_selector and the fee
+    is estimated from fee_rate in satoshis per KB. If raw is set, the transaction
+    is signed and serialized directly and returned as a RawTransaction.
+    """
+    if fee is None:
+        pay_utxos, fee = select_pay_utxos(pay_utxos,
+                                          [commit_note_input_weight(note_payload)],
+                                          note_utxo.satoshis,
+                                          [to],
+                                          change,
+                                          fee_rate,
+                                          coin_selector)
 
     pubkey = private_key.get_public_key().to_hex()
     p2note = generate_p2tr_commit_note_info(note_payload, pubkey, network)
 
+    if raw:
+        return _build_p2tr_commit_note_raw_tx(private_key, p2note, note_payload, note_utxo,
+                                              pay_utxos, to, change, network, fee)
+
     tap_leaf_script = {
         p2note['noteP2TR']['witness']: (
             p2note['noteRedeem']['output'],
@@ -40,7 +64,7 @@ def create_p2tr_commit_note_psbt(
     psbt_in = []
     tx_in = []
     # Add note UTXOs to PSBT
-    script = p2note['noteP2TR']['output'].hex()
+    script = p2note['noteP2TR']['output']
     tx_in.append(
             TxIn(prev_out=OutPoint(tx_id=note_utxo.tx_id, vout=note_utxo.output_index),
                 sequence=MAX_SEQUENCE
@@ -78,7 +102,9 @@ def create_p2tr_commit_note_psbt(
                 inputs=psbt_in, outputs=psbt_out, hd_key_paths={}, version=0)
 
     # Sign inputs
-    sign_psbt_input(private_key, psbt, 0)
+    taproot_cache = TaprootSighashCache.from_psbt(psbt)
+    segwit_v0_cache = SegwitV0SighashCache(psbt.tx)
+    sign_psbt_input(private_key, psbt, 0, taproot_cache, segwit_v0_cache)
 
     for i in range(1, len(psbt.inputs)):
         pay_utxo = pay_utxos[i - 1]
@@ -86,7 +112,7 @@ def create_p2tr_commit_note_psbt(
             privkey = PrivateKey(pay_utxo.private_key_wif)
         else:
             privkey = private_key
-        sign_psbt_input(privkey, psbt, i)
+        sign_psbt_input(privkey, psbt, i, taproot_cache, segwit_v0_cache)
 
     script_solution = [
         list(psbt.inputs[0].taproot_script_spend_signatures.values())[0]
@@ -125,3 +151,24 @@ def create_p2tr_commit_note_psbt(
         psbt.inputs[i].taproot_leaf_scripts = {}
 
     return extract_tx(psbt)
+
+def _build_p2tr_commit_note_raw_tx(private_key, p2note, note_payload: NotePayload, note_utxo: IUtxo,
+                                   pay_utxos: List[IUtxo], to, change: str, network: str, fee: int):
+    inputs = [utxo_input(note_utxo,
+                         p2note['noteP2TR']['output'],
+                         private_key,
+                         leaf_script=p2note['noteRedeem']['output'],
+                         control_block=p2note['noteP2TR']['witness'])]
+    inputs += pay_utxo_inputs(private_key, pay_utxos, network)
+    total_input = sum(raw_input.prevout.value for raw_input in inputs)
+
+    tx_out = [TxOut(to.amount, ScriptPubKey.from_address(to.address))]
+    value = total_input - to.amount - fee
+    if value < 0:
+        raise ValueError("NoFund")
+    if value > MIN_SATOSHIS:
+        tx_out.append(TxOut(value, ScriptPubKey.from_address(change)))
+
+    if note_payload.locktime is None:
+        note_payload.locktime = 0
+    return build_raw_tx(inputs, tx_out, note_payload.locktime)
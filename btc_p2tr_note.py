@@ -6,23 +6,90 @@ from btclib.script import ScriptPubKey, witness
 
 from bitcoinutils.keys import PrivateKey
 
-from btc_psbt import sign_psbt_input, add_psbt_pay_utxos
+from btc_psbt import sign_psbt_input, add_psbt_pay_utxos, TaprootSighashCache, SegwitV0SighashCache
 from btc_notes import generate_p2tr_note_info
+from btc_coin_select import select_coins, select_pay_utxos
+from btc_vsize import p2tr_note_input_weights
+from btc_raw_tx import utxo_input, pay_utxo_inputs, build_raw_tx
 
 from n_types import NotePayload, IUtxo, ISendToAddress
 from config import MIN_SATOSHIS
 from constants import MAX_SEQUENCE
 
-def create_p2tr_note_psbt(private_key,
-                          note_payload: NotePayload,
-                          note_utxos: List[IUtxo],
-                          pay_utxos: List[IUtxo],
-                          to_addresses: List[ISendToAddress],
-                          change: str,
-                          network: str,
-                          fee_rate: int,
-                          fee: int = 1000):
-    
+def note_tx_outputs(to_addresses: List[ISendToAddress], change: str, total_input: int, fee: int):
+    """
+    Returns the outputs paying to_addresses and the change, if it is above dust.
+    """
+    tx_out = []
+    total_output = 0
+    for to in to_addresses:
+        tx_out.append(TxOut(to.amount, ScriptPubKey.from_address(to.address)))
+        total_output += to.amount
+
+    value = total_input - total_output - fee
+    if value < 0:
+        raise ValueError("NoFund")
+    if value > MIN_SATOSHIS:
+        tx_out.append(TxOut(value, ScriptPubKey.from_address(change)))
+    return tx_out
+
+def build_p2tr_note_raw_tx(private_key,
+                           note_payload: NotePayload,
+                           note_utxos: List[IUtxo],
+                           pay_utxos: List[IUtxo],
+                           to_addresses: List[ISendToAddress],
+                           change: str,
+                           network: str,
+                           fee: int):
+    """
+    Builds and signs the P2TR NOTE transaction without a PSBT.
+
+    Returns:
+        The signed RawTransaction.
+    """
+    pubkey = private_key.get_public_key().to_hex()
+    p2note = generate_p2tr_note_info(pubkey, network)
+
+    inputs = []
+    for i, note_utxo in enumerate(note_utxos):
+        if note_utxo.private_key_wif is not None:
+            privkey = PrivateKey(note_utxo.private_key_wif)
+        else:
+            privkey = private_key
+        if i == 0:
+            # The first note input reveals the payload through the note script
+            inputs.append(utxo_input(note_utxo,
+                                     p2note['noteP2TR']['output'],
+                                     privkey,
+                                     leaf_script=p2note['noteRedeem']['output'],
+                                     control_block=p2note['noteP2TR']['witness'],
+                                     stack=note_payload.segments()))
+        else:
+            inputs.append(utxo_input(note_utxo,
+                                     p2note['p2pkP2TR']['output'],
+                                     privkey,
+                                     leaf_script=p2note['p2pkRedeem']['output'],
+                                     control_block=p2note['p2pkP2TR']['witness']))
+    inputs += pay_utxo_inputs(private_key, pay_utxos, network)
+
+    total_input = sum(raw_input.prevout.value for raw_input in inputs)
+    tx_out = note_tx_outputs(to_addresses, change, total_input, fee)
+    return build_raw_tx(inputs, tx_out, note_payload.locktime)
+
+def build_p2tr_note_psbt(private_key,
+                         note_payload: NotePayload,
+                         note_utxos: List[IUtxo],
+                         pay_utxos: List[IUtxo],
+                         to_addresses: List[ISendToAddress],
+                         change: str,
+                         network: str,
+                         fee: int):
+    """
+    Builds the unsigned P2TR NOTE PSBT.
+
+    Returns:
+        A tuple of the unsigned Psbt and the P2TR NOTE info used for its note inputs.
+    """
     pubkey = private_key.get_public_key().to_hex()
     p2note = generate_p2tr_note_info(pubkey, network)
     tap_leaf_note_script = {
@@ -45,10 +112,10 @@ def create_p2tr_note_psbt(private_key,
     # Add note UTXOs to PSBT
     for i, note_utxo in enumerate(note_utxos):
         if i == 0:
-            script = p2note['noteP2TR']['output'].hex()
+            script = p2note['noteP2TR']['output']
             tap_leaf_script = tap_leaf_note_script
         else:
-            script = p2note['p2pkP2TR']['output'].hex()
+            script = p2note['p2pkP2TR']['output']
             tap_leaf_script = tap_leaf_p2pk_script
 
         tx_in.append(
@@ -63,32 +130,68 @@ def create_p2tr_note_psbt(private_key,
     # Add payment UTXOs to PSBT
     total_input += add_psbt_pay_utxos(private_key, psbt_in, tx_in, pay_utxos, network)
 
-    psbt_out = []
-    tx_out = []
-    # Add outputs
-    total_output = 0
-    for to in to_addresses:
-        psbt_out.append(PsbtOut())
-        tx_out.append(TxOut(to.amount, ScriptPubKey.from_address(to.address)))
-        total_output += to.amount
-
-    value = total_input - total_output - fee
-    if value < 0:
-        raise ValueError("NoFund")
-    if value > MIN_SATOSHIS:
-        psbt_out.append(PsbtOut())
-        tx_out.append(TxOut(value, ScriptPubKey.from_address(change)))
+    tx_out = note_tx_outputs(to_addresses, change, total_input, fee)
+    psbt_out = [PsbtOut() for _ in tx_out]
 
     psbt = Psbt(tx=Tx(version=2, lock_time=note_payload.locktime, vin=tx_in, vout=tx_out),
                 inputs=psbt_in, outputs=psbt_out, hd_key_paths={}, version=0)
+    return psbt, p2note
+
+def create_p2tr_note_psbt(private_key,
+                          note_payload: NotePayload,
+                          note_utxos: List[IUtxo],
+                          pay_utxos: List[IUtxo],
+                          to_addresses: List[ISendToAddress],
+                          change: str,
+                          network: str,
+                          fee_rate: int,
+                          fee: int = None,
+                          coin_selector=select_coins,
+                          raw: bool = False):
+    """
+    Creates the signed P2TR NOTE transaction.
+
+    If fee is None, the pay UTXOs to spend are chosen by coin_selector and the fee
+    is estimated from fee_rate in satoshis per KB. If raw is set, the transaction
+    is signed and serialized directly and returned as a RawTransaction.
+    """
+    if fee is None:
+        pay_utxos, fee = select_pay_utxos(pay_utxos,
+                                          p2tr_note_input_weights(note_payload, note_utxos),
+                                          sum(note_utxo.satoshis for note_utxo in note_utxos),
+                                          to_addresses,
+                                          change,
+                                          fee_rate,
+                                          coin_selector)
+
+    if raw:
+        return build_p2tr_note_raw_tx(private_key,
+                                      note_payload,
+                                      note_utxos,
+                                      pay_utxos,
+                                      to_addresses,
+                                      change,
+                                      network,
+                                      fee)
+
+    psbt, p2note = build_p2tr_note_psbt(private_key,
+                                        note_payload,
+                                        note_utxos,
+                                        pay_utxos,
+                                        to_addresses,
+                                        change,
+                                        network,
+                                        fee)
 
     # Sign inputs
+    taproot_cache = TaprootSighashCache.from_psbt(psbt)
+    segwit_v0_cache = SegwitV0SighashCache(psbt.tx)
     for i, note_utxo in enumerate(note_utxos):
         if note_utxo.private_key_wif is not None:
             privkey = PrivateKey(note_utxo.private_key_wif)
         else:
             privkey = private_key
-        sign_psbt_input(privkey, psbt, i)
+        sign_psbt_input(privkey, psbt, i, taproot_cache, segwit_v0_cache)
 
     for i in range(len(note_utxos), len(psbt.inputs)):
         pay_utxo = pay_utxos[i - len(note_utxos)]
@@ -96,15 +199,11 @@ def create_p2tr_note_psbt(private_key,
             privkey = PrivateKey(pay_utxo.private_key_wif)
         else:
             privkey = private_key
-        sign_psbt_input(privkey, psbt, i)
+        sign_psbt_input(privkey, psbt, i, taproot_cache, segwit_v0_cache)
 
     script_solution = [
         list(psbt.inputs[0].taproot_script_spend_signatures.values())[0],
-        bytes.fromhex(note_payload.data0),
-        bytes.fromhex(note_payload.data1),
-        bytes.fromhex(note_payload.data2),
-        bytes.fromhex(note_payload.data3),
-        bytes.fromhex(note_payload.data4),
+        *note_payload.segments(),
     ]
     script_solution.append(p2note['noteRedeem']['output'])
     script_solution.append(p2note['noteP2TR']['witness'])
@@ -10,8 +10,9 @@ from btclib.psbt.psbt import Psbt, PsbtIn
 from btclib.tx.tx import TxOut, Tx, TxIn
 from btclib.tx.out_point import OutPoint
 from btclib.script import ScriptPubKey
+from btclib.script.script_pub_key import is_p2wpkh
 from btclib.script.sig_hash import from_tx
-from btclib.hashes import sha256, tagged_hash
+from btclib.hashes import sha256, hash256, tagged_hash
 
 from bitcointx.core.key import CKey
 
@@ -29,6 +30,12 @@ SIGHASH_INPUT_MASK = 0x80
 ADVANCED_TRANSACTION_MARKER = 0x00
 ADVANCED_TRANSACTION_FLAG = 0x01
 
+_UINT8 = struct.Struct('<B')
+_UINT16 = struct.Struct('<H')
+_UINT32 = struct.Struct('<I')
+_INT32 = struct.Struct('<i')
+_UINT64 = struct.Struct('<Q')
+
 class BufferWriter:
     def __init__(self, capacity):
         self.buffer = bytearray(capacity)
@@ -44,19 +51,19 @@ class BufferWriter:
         self.offset += length
 
     def write_uint32(self, value):
-        self.buffer[self.offset:self.offset+4] = struct.pack('<I', value)
+        _UINT32.pack_into(self.buffer, self.offset, value)
         self.offset += 4
 
     def write_uint64(self, value):
-        self.buffer[self.offset:self.offset+8] = struct.pack('<Q', value)
+        _UINT64.pack_into(self.buffer, self.offset, value)
         self.offset += 8
 
     def write_int32(self, value):
-        self.buffer[self.offset:self.offset+4] = struct.pack('<i', value)
+        _INT32.pack_into(self.buffer, self.offset, value)
         self.offset += 4
 
     def write_uint8(self, value):
-        self.buffer[self.offset:self.offset+1] = struct.pack('<B', value)
+        _UINT8.pack_into(self.buffer, self.offset, value)
         self.offset += 1
 
     def write_var_slice(self, data):
@@ -78,9 +85,14 @@ class BufferWriter:
             self.write_uint64(value)
 
     def write_uint16(self, value):
-        self.buffer[self.offset:self.offset+2] = struct.pack('<H', value)
+        _UINT16.pack_into(self.buffer, self.offset, value)
         self.offset += 2
 
+    def write_vector(self, items):
+        self.write_var_int(len(items))
+        for item in items:
+            self.write_var_slice(item)
+
     def end(self):
         return bytes(self.buffer[:self.offset])
 
@@ -118,7 +130,7 @@ def add_psbt_pay_utxos(
                     sequence=MAX_SEQUENCE)
                 )
             psbt_in.append(PsbtIn(witness_utxo=TxOut(value=utxo.satoshis,
-                    script_pub_key=ScriptPubKey(bytes.fromhex(utxo.script)))
+                    script_pub_key=ScriptPubKey(utxo.script))
                 ))
             total_input += utxo.satoshis
 
@@ -128,7 +140,7 @@ def add_psbt_pay_utxos(
                      sequence=MAX_SEQUENCE)
                 )
             psbt_in.append(PsbtIn(witness_utxo=TxOut(value=utxo.satoshis,
-                    script_pub_key=ScriptPubKey(bytes.fromhex(utxo.script))),
+                    script_pub_key=ScriptPubKey(utxo.script)),
                 ))
             total_input += utxo.satoshis
 
@@ -138,7 +150,7 @@ def add_psbt_pay_utxos(
                      sequence=MAX_SEQUENCE)
                 )
             psbt_in.append(PsbtIn(witness_utxo=TxOut(value=utxo.satoshis,
-                    script_pub_key=ScriptPubKey(bytes.fromhex(utxo.script))),
+                    script_pub_key=ScriptPubKey(utxo.script)),
                 ))
             total_input += utxo.satoshis
         elif utxo.type == AddressType.P2TR_NOTE:
@@ -161,35 +173,221 @@ def add_psbt_pay_utxos(
 
     return total_input
 
-def sign_psbt_input(private_key: PrivateKey, psbt: Psbt, input_index: int):
+def _hash_prevouts(tx:Tx):
+    buffer_writer = BufferWriter.with_capacity(36 * len(tx.vin))
+    for tx_in in tx.vin:
+        buffer_writer.write_slice(
+            tx_in.prev_out.hash.to_bytes(length=32, byteorder='little',signed=False))
+        buffer_writer.write_uint32(tx_in.prev_out.vout)
+    return sha256(buffer_writer.end())
+
+def _hash_amounts(values):
+    buffer_writer = BufferWriter.with_capacity(8 * len(values))
+    for value in values:
+        buffer_writer.write_uint64(value)
+    return sha256(buffer_writer.end())
+
+def _hash_script_pubkeys(prev_out_scripts):
+    buffer_writer = BufferWriter.with_capacity(
+        sum(var_slice_size(script) for script in prev_out_scripts))
+    for prev_out_script in prev_out_scripts:
+        buffer_writer.write_var_slice(prev_out_script)
+    return sha256(buffer_writer.end())
+
+def _hash_sequences(tx:Tx):
+    buffer_writer = BufferWriter.with_capacity(4 * len(tx.vin))
+    for tx_in in tx.vin:
+        buffer_writer.write_uint32(tx_in.sequence)
+    return sha256(buffer_writer.end())
+
+def _hash_outputs(outputs):
+    tx_outs_size = sum(8 + var_slice_size(output.script_pub_key.script) for output in outputs)
+    buffer_writer = BufferWriter.with_capacity(tx_outs_size)
+    for out in outputs:
+        buffer_writer.write_uint64(out.value)
+        buffer_writer.write_var_slice(out.script_pub_key.script)
+    return sha256(buffer_writer.end())
+
+class TaprootSighashCache:
+    """
+    Precomputed BIP341 sighash state of a transaction.
+
+    hash_prevouts, hash_amounts, hash_script_pubkeys, hash_sequences and hash_outputs
+    only depend on the inputs and outputs, so they are computed once on first use and
+    shared by every input signed with SIGHASH_DEFAULT/SIGHASH_ALL. nVersion and
+    nLockTime are still read from the tx, so the cache stays valid when only the
+    locktime changes. Build a new cache if inputs or outputs are modified.
+    """
+    def __init__(self, tx:Tx, prev_out_scripts, values):
+        if len(values) != len(tx.vin) or len(prev_out_scripts) != len(tx.vin):
+            raise ValueError('Must supply prevout script and value for all inputs')
+        self.tx = tx
+        self.prev_out_scripts = prev_out_scripts
+        self.values = values
+        self._hash_inputs = None
+        self._hash_outputs = None
+
+    @staticmethod
+    def from_psbt(psbt: Psbt):
+        return TaprootSighashCache(
+            psbt.tx,
+            [psbt_input.witness_utxo.script_pub_key.script for psbt_input in psbt.inputs],
+            [psbt_input.witness_utxo.value for psbt_input in psbt.inputs])
+
+    @property
+    def hash_inputs(self):
+        """hash_prevouts, hash_amounts, hash_script_pubkeys and hash_sequences"""
+        if self._hash_inputs is None:
+            self._hash_inputs = (_hash_prevouts(self.tx),
+                                 _hash_amounts(self.values),
+                                 _hash_script_pubkeys(self.prev_out_scripts),
+                                 _hash_sequences(self.tx))
+        return self._hash_inputs
+
+    @property
+    def hash_outputs(self):
+        if self._hash_outputs is None:
+            self._hash_outputs = _hash_outputs(self.tx.vout)
+        return self._hash_outputs
+
+class SegwitV0SighashCache:
+    """
+    Precomputed BIP143 sighash state of a transaction.
+
+    hashPrevouts, hashSequence and hashOutputs are computed once on first use and
+    shared by every segwit v0 input signed with SIGHASH_ALL. nVersion and nLockTime
+    are still read from the tx. Build a new cache if inputs or outputs are modified.
+    """
+    def __init__(self, tx:Tx):
+        self.tx = tx
+        self._hash_prevouts = None
+        self._hash_sequences = None
+        self._hash_outputs = None
+
+    @property
+    def hash_prevouts(self):
+        if self._hash_prevouts is None:
+            self._hash_prevouts = _hash256_prevouts(self.tx)
+        return self._hash_prevouts
+
+    @property
+    def hash_sequences(self):
+        if self._hash_sequences is None:
+            self._hash_sequences = _hash256_sequences(self.tx)
+        return self._hash_sequences
+
+    @property
+    def hash_outputs(self):
+        if self._hash_outputs is None:
+            self._hash_outputs = _hash256_outputs(self.tx.vout)
+        return self._hash_outputs
+
+def _hash256_prevouts(tx:Tx):
+    buffer_writer = BufferWriter.with_capacity(36 * len(tx.vin))
+    for tx_in in tx.vin:
+        buffer_writer.write_slice(
+            tx_in.prev_out.hash.to_bytes(length=32, byteorder='little',signed=False))
+        buffer_writer.write_uint32(tx_in.prev_out.vout)
+    return hash256(buffer_writer.end())
+
+def _hash256_sequences(tx:Tx):
+    buffer_writer = BufferWriter.with_capacity(4 * len(tx.vin))
+    for tx_in in tx.vin:
+        buffer_writer.write_uint32(tx_in.sequence)
+    return hash256(buffer_writer.end())
+
+def _hash256_outputs(outputs):
+    tx_outs_size = sum(8 + var_slice_size(output.script_pub_key.script) for output in outputs)
+    buffer_writer = BufferWriter.with_capacity(tx_outs_size)
+    for out in outputs:
+        buffer_writer.write_uint64(out.value)
+        buffer_writer.write_var_slice(out.script_pub_key.script)
+    return hash256(buffer_writer.end())
+
+def p2wpkh_script_code(script_pub_key: bytes):
+    """
+    Returns the BIP143 scriptCode (OP_DUP OP_HASH160 <hash> OP_EQUALVERIFY OP_CHECKSIG)
+    of a P2WPKH scriptPubKey.
+    """
+    return b'\x76\xa9\x14' + script_pub_key[2:22] + b'\x88\xac'
+
+def hash_for_witness_v0(tx:Tx,
+                        in_index:int,
+                        script_code:bytes,
+                        value:int,
+                        hash_type=SIGHASH_ALL,
+                        cache:SegwitV0SighashCache=None):
+    zero_hash = b'\x00' * 32
+    output_type = hash_type & 0x1f
+    is_anyone_can_pay = hash_type & SIGHASH_ANYONECANPAY
+    is_none = output_type == SIGHASH_NONE
+    is_single = output_type == SIGHASH_SINGLE
+    hash_prevouts = zero_hash
+    hash_sequences = zero_hash
+    hash_outputs = zero_hash
+    if not is_anyone_can_pay:
+        hash_prevouts = cache.hash_prevouts if cache is not None else _hash256_prevouts(tx)
+    if not (is_anyone_can_pay or is_none or is_single):
+        hash_sequences = cache.hash_sequences if cache is not None else _hash256_sequences(tx)
+    if not (is_none or is_single):
+        hash_outputs = cache.hash_outputs if cache is not None else _hash256_outputs(tx.vout)
+    elif is_single and in_index < len(tx.vout):
+        hash_outputs = _hash256_outputs([tx.vout[in_index]])
+    txinput = tx.vin[in_index]
+    sig_msg_writer = BufferWriter.with_capacity(156 + var_slice_size(script_code))
+    sig_msg_writer.write_int32(tx.version)
+    sig_msg_writer.write_slice(hash_prevouts)
+    sig_msg_writer.write_slice(hash_sequences)
+    sig_msg_writer.write_slice(
+        txinput.prev_out.hash.to_bytes(length=32, byteorder='little',signed=False))
+    sig_msg_writer.write_uint32(txinput.prev_out.vout)
+    sig_msg_writer.write_var_slice(script_code)
+    sig_msg_writer.write_uint64(value)
+    sig_msg_writer.write_uint32(txinput.sequence)
+    sig_msg_writer.write_slice(hash_outputs)
+    sig_msg_writer.write_uint32(tx.lock_time)
+    sig_msg_writer.write_uint32(hash_type)
+    return hash256(sig_msg_writer.end())
+
+def tapleaf_hash(taproot_leaf_scripts):
+    preimage = b""
+    for script in taproot_leaf_scripts:
+        preimage += taproot_leaf_scripts[script][1].to_bytes(1, "little")
+
+        script_len = len(taproot_leaf_scripts[script][0])
+        if script_len < 0xfd:
+            preimage += script_len.to_bytes(1, "little")
+        elif script_len < 0xffff:
+            preimage += b'\xfd' + script_len.to_bytes(2, "little")
+        elif script_len < 0xffffffff:
+            preimage += b'\xfe' + script_len.to_bytes(4, "little")
+        else:
+            preimage += b'\xff' + script_len.to_bytes(8, "little")
+        preimage += taproot_leaf_scripts[script][0]
+    return tagged_hash(b"TapLeaf", preimage)
+
+def sign_psbt_input(private_key: PrivateKey,
+                    psbt: Psbt,
+                    input_index: int,
+                    taproot_cache: TaprootSighashCache = None,
+                    segwit_v0_cache: SegwitV0SighashCache = None):
+    """
+    Signs an input of the PSBT.
+
+    Pass the same taproot_cache and segwit_v0_cache for every input of the PSBT to
+    compute the BIP341 and BIP143 sighash midstates only once per transaction.
+    """
     input = psbt.inputs[input_index]
     pubkey = private_key.get_public_key().to_bytes()
     x_only_pubkey = to_x_only(pubkey)
 
     if input.taproot_leaf_scripts != {}:
-        taproot_leaf_scripts = input.taproot_leaf_scripts
-        preimage = b""
-        for script in taproot_leaf_scripts:
-            preimage += taproot_leaf_scripts[script][1].to_bytes(1, "little")
-
-            script_len = len(taproot_leaf_scripts[script][0])
-            if script_len < 0xfd:
-                preimage += script_len.to_bytes(1, "little")
-            elif script_len < 0xffff:
-                preimage += b'\xfd' + script_len.to_bytes(2, "little")
-            elif script_len < 0xffffffff:
-                preimage += b'\xfe' + script_len.to_bytes(4, "little")
-            else:
-                preimage += b'\xff' + script_len.to_bytes(8, "little")
-            preimage += taproot_leaf_scripts[script][0]
-        vout_scripts = []
-        values = []
-        for vout in psbt.inputs:
-            vout_scripts.append(vout.witness_utxo.script_pub_key.script)
-            values.append(vout.witness_utxo.value)
-        tapleaf_hash = tagged_hash(b"TapLeaf", preimage)
-        hash_for_sig = hash_for_witness_v1(psbt.tx, input_index, vout_scripts,
-                                           values, 0, tapleaf_hash, None)
+        if taproot_cache is None:
+            taproot_cache = TaprootSighashCache.from_psbt(psbt)
+        hash_for_sig = hash_for_witness_v1(psbt.tx, input_index, taproot_cache.prev_out_scripts,
+                                           taproot_cache.values, 0,
+                                           tapleaf_hash(input.taproot_leaf_scripts), None,
+                                           taproot_cache)
         ex_key = CKey(private_key.to_bytes())
         signature = ex_key.sign_schnorr_no_tweak(hash_for_sig)
         psbt.inputs[input_index].taproot_script_spend_signatures = {pubkey:signature}
@@ -206,10 +404,19 @@ def sign_psbt_input(private_key: PrivateKey, psbt: Psbt, input_index: int):
         psbt.inputs[input_index].partial_sigs[bytes(ex_key.pub)] = signature + bytes([SIGHASH_ALL])
 #        psbt.validate_signatures_of_input(input_index, dsa.schnorr)    TODO
     else:
-        in_utxos = []
-        for psbt_input in psbt.inputs:
-            in_utxos.append(psbt_input.witness_utxo)
-        hash_for_sig = from_tx(in_utxos, psbt.tx, input_index, SIGHASH_ALL)
+        witness_utxo = input.witness_utxo
+        if is_p2wpkh(witness_utxo.script_pub_key.script):
+            if segwit_v0_cache is None:
+                segwit_v0_cache = SegwitV0SighashCache(psbt.tx)
+            hash_for_sig = hash_for_witness_v0(
+                psbt.tx, input_index,
+                p2wpkh_script_code(witness_utxo.script_pub_key.script),
+                witness_utxo.value, SIGHASH_ALL, segwit_v0_cache)
+        else:
+            in_utxos = []
+            for psbt_input in psbt.inputs:
+                in_utxos.append(psbt_input.witness_utxo)
+            hash_for_sig = from_tx(in_utxos, psbt.tx, input_index, SIGHASH_ALL)
         ex_key = CKey(private_key.to_bytes())
         signature = ex_key.sign(hash_for_sig)
         psbt.inputs[input_index].partial_sigs[bytes(ex_key.pub)] = signature + bytes([SIGHASH_ALL])
@@ -221,7 +428,8 @@ def hash_for_witness_v1(tx:Tx,
                         values,
                         hash_type,
                         leaf_hash=None,
-                        annex=None):
+                        annex=None,
+                        cache:TaprootSighashCache=None):
     if len(values) != len(tx.vin) or len(prev_out_scripts) != len(tx.vin):
         raise ValueError('Must supply prevout script and value for all inputs')
     output_type = SIGHASH_ALL if hash_type == SIGHASH_DEFAULT else hash_type & SIGHASH_OUTPUT_MASK
@@ -235,38 +443,20 @@ def hash_for_witness_v1(tx:Tx,
     hash_sequences = EMPTY_BUFFER
     hash_outputs = EMPTY_BUFFER
     if not is_anyone_can_pay:
-        buffer_writer = BufferWriter.with_capacity(36 * len(tx.vin))
-        for tx_in in tx.vin:
-            buffer_writer.write_slice(
-                tx_in.prev_out.hash.to_bytes(length=32, byteorder='little',signed=False))
-            buffer_writer.write_uint32(tx_in.prev_out.vout)
-        hash_prevouts = sha256(buffer_writer.end())
-        buffer_writer = BufferWriter.with_capacity(8 * len(tx.vin))
-        for value in values:
-            buffer_writer.write_uint64(value)
-        hash_amounts = sha256(buffer_writer.end())
-        buffer_writer = BufferWriter.with_capacity(
-            sum(var_slice_size(script) for script in prev_out_scripts))
-        for prev_out_script in prev_out_scripts:
-            buffer_writer.write_var_slice(prev_out_script)
-        hash_script_pubkeys = sha256(buffer_writer.end())
-        buffer_writer = BufferWriter.with_capacity(4 * len(tx.vin))
-        for tx_in in tx.vin:
-            buffer_writer.write_uint32(tx_in.sequence)
-        hash_sequences = sha256(buffer_writer.end())
+        if cache is not None:
+            hash_prevouts, hash_amounts, hash_script_pubkeys, hash_sequences = cache.hash_inputs
+        else:
+            hash_prevouts = _hash_prevouts(tx)
+            hash_amounts = _hash_amounts(values)
+            hash_script_pubkeys = _hash_script_pubkeys(prev_out_scripts)
+            hash_sequences = _hash_sequences(tx)
     if not (is_none or is_single):
-        tx_outs_size = sum(8 + var_slice_size(output.script_pub_key.script) for output in tx.vout)
-        buffer_writer = BufferWriter.with_capacity(tx_outs_size)
-        for out in tx.vout:
-            buffer_writer.write_uint64(out.value)
-            buffer_writer.write_var_slice(out.script_pub_key.script)
-        hash_outputs = sha256(buffer_writer.end())
+        if cache is not None:
+            hash_outputs = cache.hash_outputs
+        else:
+            hash_outputs = _hash_outputs(tx.vout)
     elif is_single and in_index < len(tx.vout):
-        output = tx.vout[in_index]
-        buffer_writer = BufferWriter.with_capacity(8 + var_slice_size(output.script_pub_key.script))
-        buffer_writer.write_uint64(output.value)
-        buffer_writer.write_var_slice(output.script_pub_key.script)
-        hash_outputs = sha256(buffer_writer.end())
+        hash_outputs = _hash_outputs([tx.vout[in_index]])
     spend_type = (2 if leaf_hash else 0) + (1 if annex else 0)
     sig_msg_size = 174 - (49 if is_anyone_can_pay else 0) - (32 if is_none else 0)
     sig_msg_size = sig_msg_size + (32 if annex else 0) + (37 if leaf_hash else 0)
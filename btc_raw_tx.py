@@ -0,0 +1,176 @@
+"""
+Raw transaction building without PSBTs.
+
+The fast path of the coin, note and commit note builders signs the inputs straight
+from their prevouts and writes the witness serialization with BufferWriter. It
+produces the same transaction as the PSBT path without the PsbtIn/PsbtOut objects,
+their finalization and extract_tx.
+"""
+from dataclasses import dataclass, field
+from typing import List, Optional
+from math import ceil
+
+from btclib.tx.tx import TxOut, Tx, TxIn
+from btclib.tx.out_point import OutPoint
+from btclib.script import ScriptPubKey
+from btclib.script.script_pub_key import is_p2wpkh
+from btclib.script.sig_hash import from_tx
+from btclib.hashes import hash256
+
+from bitcoinutils.setup import setup
+from bitcoinutils.keys import PrivateKey
+from bitcoinutils.constants import SIGHASH_ALL
+
+from bitcointx.core.key import CKey
+
+from btc_psbt import BufferWriter, TaprootSighashCache, SegwitV0SighashCache, hash_for_witness_v1, \
+    hash_for_witness_v0, p2wpkh_script_code, tapleaf_hash, var_slice_size, varint_size
+from btc_notes import generate_p2tr_note_info
+from n_types import AddressType, IUtxo
+from constants import MAX_SEQUENCE
+
+LEAF_VERSION = 192
+
+
+@dataclass
+class RawInput:
+    """
+    An input to sign, with its prevout and the way it is spent.
+
+    Inputs with a leaf_script are spent through that tapscript leaf, with the
+    witness [signature, *stack, leaf_script, control_block]. The others get the
+    ECDSA witness [signature, pubkey].
+    """
+    tx_in: TxIn
+    prevout: TxOut
+    private_key: PrivateKey
+    leaf_script: Optional[bytes] = None
+    control_block: Optional[bytes] = None
+    stack: List[bytes] = field(default_factory=list)
+
+def utxo_input(utxo: IUtxo, script_pub_key: bytes, private_key: PrivateKey, **kwargs) -> RawInput:
+    return RawInput(
+        tx_in=TxIn(prev_out=OutPoint(tx_id=utxo.tx_id, vout=utxo.output_index),
+                   sequence=MAX_SEQUENCE),
+        prevout=TxOut(value=utxo.satoshis, script_pub_key=ScriptPubKey(script_pub_key)),
+        private_key=private_key,
+        **kwargs)
+
+def pay_utxo_inputs(private_key: PrivateKey, utxos: List[IUtxo], network: str) -> List[RawInput]:
+    """
+    Returns the inputs spending the pay UTXOs the way add_psbt_pay_utxos does.
+    """
+    setup(network)
+    inputs = []
+    for utxo in utxos:
+        privkey = private_key
+        if utxo.private_key_wif:
+            privkey = PrivateKey(utxo.private_key_wif)
+
+        if utxo.type == AddressType.P2TR_NOTE:
+            p2note = generate_p2tr_note_info(privkey.get_public_key().to_hex(), network)
+            inputs.append(utxo_input(utxo,
+                                     p2note['p2pkP2TR']['output'],
+                                     privkey,
+                                     leaf_script=p2note['p2pkRedeem']['output'],
+                                     control_block=p2note['p2pkP2TR']['witness']))
+        elif utxo.type in (AddressType.P2WPKH, AddressType.P2WSH, AddressType.P2TR):
+            inputs.append(utxo_input(utxo, utxo.script, privkey))
+    return inputs
+
+class RawTransaction:
+    """
+    A signed transaction with its witnesses kept apart from the btclib Tx, so it
+    can be serialized in one BufferWriter pass.
+    """
+    def __init__(self, tx: Tx, witnesses: List[List[bytes]]):
+        self.tx = tx
+        self.witnesses = witnesses
+        self._serialized = {}
+
+    @property
+    def vin(self):
+        return self.tx.vin
+
+    @property
+    def vout(self):
+        return self.tx.vout
+
+    def _base_size(self):
+        return 4 + varint_size(len(self.tx.vin)) + 41 * len(self.tx.vin) + \
+            varint_size(len(self.tx.vout)) + \
+            sum(8 + var_slice_size(tx_out.script_pub_key.script) for tx_out in self.tx.vout) + 4
+
+    def _witness_size(self):
+        return 2 + sum(varint_size(len(items)) + sum(var_slice_size(item) for item in items)
+                       for items in self.witnesses)
+
+    def serialize(self, include_witness: bool = True) -> bytes:
+        if include_witness not in self._serialized:
+            capacity = self._base_size() + (self._witness_size() if include_witness else 0)
+            buffer_writer = BufferWriter.with_capacity(capacity)
+            buffer_writer.write_int32(self.tx.version)
+            if include_witness:
+                buffer_writer.write_slice(b'\x00\x01')
+            buffer_writer.write_var_int(len(self.tx.vin))
+            for tx_in in self.tx.vin:
+                buffer_writer.write_slice(tx_in.prev_out.tx_id[::-1])
+                buffer_writer.write_uint32(tx_in.prev_out.vout)
+                buffer_writer.write_uint8(0)  # empty scriptSig
+                buffer_writer.write_uint32(tx_in.sequence)
+            buffer_writer.write_var_int(len(self.tx.vout))
+            for tx_out in self.tx.vout:
+                buffer_writer.write_uint64(tx_out.value)
+                buffer_writer.write_var_slice(tx_out.script_pub_key.script)
+            if include_witness:
+                for items in self.witnesses:
+                    buffer_writer.write_vector(items)
+            buffer_writer.write_uint32(self.tx.lock_time)
+            self._serialized[include_witness] = buffer_writer.end()
+        return self._serialized[include_witness]
+
+    @property
+    def id(self) -> bytes:
+        return hash256(self.serialize(include_witness=False))[::-1]
+
+    @property
+    def weight(self) -> int:
+        return self._base_size() * 4 + self._witness_size()
+
+    @property
+    def vsize(self) -> int:
+        return ceil(self.weight / 4)
+
+def build_raw_tx(inputs: List[RawInput], tx_out: List[TxOut], lock_time: int = 0) -> RawTransaction:
+    """
+    Signs the inputs of a version 2 transaction and returns it.
+    """
+    tx = Tx(version=2, lock_time=lock_time, vin=[raw_input.tx_in for raw_input in inputs], vout=tx_out)
+    prevouts = [raw_input.prevout for raw_input in inputs]
+    prev_out_scripts = [prevout.script_pub_key.script for prevout in prevouts]
+    values = [prevout.value for prevout in prevouts]
+    taproot_cache = TaprootSighashCache(tx, prev_out_scripts, values)
+    segwit_v0_cache = SegwitV0SighashCache(tx)
+
+    # Inputs of the same key share its CKey, building one derives the pubkey hash
+    keys = {}
+    witnesses = []
+    for i, raw_input in enumerate(inputs):
+        secret = raw_input.private_key.to_bytes()
+        key = keys.get(secret)
+        if key is None:
+            key = keys[secret] = CKey(secret)
+        if raw_input.leaf_script is not None:
+            leaf_hash = tapleaf_hash({raw_input.control_block: (raw_input.leaf_script, LEAF_VERSION)})
+            hash_for_sig = hash_for_witness_v1(tx, i, prev_out_scripts, values, 0, leaf_hash, None,
+                                               taproot_cache)
+            witnesses.append([key.sign_schnorr_no_tweak(hash_for_sig)] + list(raw_input.stack) +
+                             [raw_input.leaf_script, raw_input.control_block])
+        else:
+            if is_p2wpkh(prev_out_scripts[i]):
+                hash_for_sig = hash_for_witness_v0(tx, i, p2wpkh_script_code(prev_out_scripts[i]),
+                                                   values[i], SIGHASH_ALL, segwit_v0_cache)
+            else:
+                hash_for_sig = from_tx(prevouts, tx, i, SIGHASH_ALL)
+            witnesses.append([key.sign(hash_for_sig) + bytes([SIGHASH_ALL]), bytes(key.pub)])
+    return RawTransaction(tx, witnesses)
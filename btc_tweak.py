@@ -20,6 +20,16 @@ def tagged_hash(tag, data):
     tag_hash = hashlib.sha256(tag.encode()).digest()
     return hashlib.sha256(tag_hash + tag_hash + data).digest()
 
+def tweak_private_key(privkey_bytes, tweak, negate):
+    """
+    Returns the private key, negated first if `negate`, plus `tweak` modulo the curve order.
+    """
+    if negate:
+        privkey_bytes = private_negate(privkey_bytes)
+    tweaked_privkey_int = (int.from_bytes(privkey_bytes, byteorder='big') +
+                           int.from_bytes(tweak, byteorder='big')) % SECP256k1.order
+    return tweaked_privkey_int.to_bytes(32, byteorder='big')
+
 class ECPair:
     def __init__(self, privkey_bytes):
         self.privkey = SigningKey.from_string(privkey_bytes, curve=SECP256k1)
@@ -29,15 +39,7 @@ class ECPair:
         return cls(privkey_bytes)
 
     def tweak(self, tweak, negate):
-        if negate:
-            private_key = private_negate(self.privkey.to_string())
-        else:
-            private_key = self.privkey.to_string()
-        tweak_int = int.from_bytes(tweak, byteorder='big')
-        privkey_int = int.from_bytes(private_key, byteorder='big')
-        tweaked_privkey_int = (privkey_int + tweak_int) % SECP256k1.order
-        tweaked_privkey_bytes = tweaked_privkey_int.to_bytes(32, byteorder='big')
-        return ECPair.from_private_key(tweaked_privkey_bytes)
+        return ECPair.from_private_key(tweak_private_key(self.privkey.to_string(), tweak, negate))
 
     def to_wif(self, network='mainnet'):
         return privkey_to_wif(self.privkey.to_string(), network)
@@ -54,5 +56,6 @@ def tweak_key_pair(private_key, public_key, is_test_net:bool):
     x_only_pubkey = public_key_bytes[1:33]
     negate = public_key_bytes[0] == 3 or (public_key_bytes[0] == 4 and (public_key_bytes[64] & 0x01) == 1)
 
-    tweaked_privkey = ECPair.from_private_key(private_key_bytes).tweak(tagged_hash("TapTweak", x_only_pubkey), negate)
-    return [tweaked_privkey.to_wif('testnet' if is_test_net else 'mainnet'), x_only_pubkey.hex()]
+    # Scalar arithmetic only, the tweaked public key is not needed here
+    tweaked_privkey = tweak_private_key(private_key_bytes, tagged_hash("TapTweak", x_only_pubkey), negate)
+    return [privkey_to_wif(tweaked_privkey, 'testnet' if is_test_net else 'mainnet'), x_only_pubkey.hex()]
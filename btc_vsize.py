@@ -0,0 +1,159 @@
+"""
+Analytic transaction weight and vsize estimation.
+
+Sizes are derived from input types, payload segment sizes and output scripts, so the
+fee of a transaction can be computed before it is built and signed.
+"""
+from typing import List
+from math import ceil
+
+from btclib.script import ScriptPubKey
+
+from btc_psbt import var_slice_size, varint_size
+from n_types import AddressType, IUtxo, NotePayload, ISendToAddress
+from constants import NOTE_PROTOCOL_ENVELOPE_ID
+
+WITNESS_SCALE_FACTOR = 4
+
+# version + locktime
+TX_OVERHEAD_SIZE = 4 + 4
+# segwit marker + flag, counted as witness data
+SEGWIT_MARKER_SIZE = 2
+# outpoint + empty scriptSig + sequence
+INPUT_BASE_SIZE = 32 + 4 + 1 + 4
+
+# DER signature plus sighash byte, upper bound
+ECDSA_SIGNATURE_SIZE = 72
+COMPRESSED_PUBKEY_SIZE = 33
+# SIGHASH_DEFAULT schnorr signature
+SCHNORR_SIGNATURE_SIZE = 64
+# internal key + one merkle branch of the two-leaf NOTE tree
+CONTROL_BLOCK_SIZE = 33 + 32
+
+# <x_only_pubkey> OP_CHECKSIG
+P2PK_LEAF_SCRIPT_SIZE = 1 + 32 + 1
+# <NOTE> OP_2DROP OP_2DROP OP_2DROP <x_only_pubkey> OP_CHECKSIG
+NOTE_LEAF_SCRIPT_SIZE = 1 + len(NOTE_PROTOCOL_ENVELOPE_ID) + 3 + P2PK_LEAF_SCRIPT_SIZE
+
+def push_data_size(length: int):
+    """
+    Returns the size of a minimal script push of data with the given length.
+    """
+    if length == 0:
+        return 1  # OP_FALSE
+    if length < 0x4c:
+        return 1 + length
+    if length <= 0xff:
+        return 2 + length
+    if length <= 0xffff:
+        return 3 + length
+    return 5 + length
+
+def payload_segments(payload: NotePayload):
+    return [len(segment) for segment in payload.segments()]
+
+def commit_note_script_size(payload: NotePayload):
+    return sum(push_data_size(length) for length in payload_segments(payload)) + NOTE_LEAF_SCRIPT_SIZE
+
+def witness_size(items: List[int]):
+    return varint_size(len(items)) + sum(varint_size(item) + item for item in items)
+
+def pay_input_weight(utxo: IUtxo):
+    """
+    Returns the weight of a pay UTXO spent the way add_psbt_pay_utxos and
+    sign_psbt_input spend it.
+    """
+    if utxo.type == AddressType.P2TR_NOTE:
+        return p2pk_leaf_input_weight()
+    return p2wpkh_input_weight()
+
+def p2wpkh_input_weight():
+    """
+    Returns the weight of a P2WPKH input.
+    """
+    return INPUT_BASE_SIZE * WITNESS_SCALE_FACTOR + \
+        witness_size([ECDSA_SIGNATURE_SIZE, COMPRESSED_PUBKEY_SIZE])
+
+def p2pk_leaf_input_weight():
+    """
+    Returns the weight of a P2TR NOTE input spent through its p2pk leaf.
+    """
+    return INPUT_BASE_SIZE * WITNESS_SCALE_FACTOR + \
+        witness_size([SCHNORR_SIGNATURE_SIZE, P2PK_LEAF_SCRIPT_SIZE, CONTROL_BLOCK_SIZE])
+
+def note_input_weight(payload: NotePayload):
+    """
+    Returns the weight of a P2TR NOTE input revealing the payload through its note leaf.
+    """
+    return INPUT_BASE_SIZE * WITNESS_SCALE_FACTOR + \
+        witness_size([SCHNORR_SIGNATURE_SIZE] + payload_segments(payload) +
+                     [NOTE_LEAF_SCRIPT_SIZE, CONTROL_BLOCK_SIZE])
+
+def p2tr_note_input_weights(payload: NotePayload, note_utxos: List[IUtxo]):
+    """
+    Returns the weights of the note inputs of create_p2tr_note_psbt, the first one
+    reveals the payload and the others are spent through the p2pk leaf.
+    """
+    return [note_input_weight(payload) if i == 0 else p2pk_leaf_input_weight()
+            for i in range(len(note_utxos))]
+
+def commit_note_input_weight(payload: NotePayload):
+    """
+    Returns the weight of a P2TR COMMIT NOTE input spent through its commit note leaf.
+    """
+    return INPUT_BASE_SIZE * WITNESS_SCALE_FACTOR + \
+        witness_size([SCHNORR_SIGNATURE_SIZE, commit_note_script_size(payload), CONTROL_BLOCK_SIZE])
+
+def output_weight(address: str):
+    script = ScriptPubKey.from_address(address).script
+    return (8 + var_slice_size(script)) * WITNESS_SCALE_FACTOR
+
+def tx_vsize(input_weights: List[int], output_weights: List[int]):
+    """
+    Returns the vsize of a segwit transaction with the given input and output weights.
+    """
+    weight = (TX_OVERHEAD_SIZE + varint_size(len(input_weights)) + varint_size(len(output_weights))) \
+        * WITNESS_SCALE_FACTOR + SEGWIT_MARKER_SIZE
+    weight += sum(input_weights) + sum(output_weights)
+    return ceil(weight / WITNESS_SCALE_FACTOR)
+
+def fee_for_vsize(vsize: int, fee_rate: int):
+    """
+    Returns the fee in satoshis for the vsize at fee_rate in satoshis per KB.
+    """
+    return int((vsize * fee_rate) / 1000 + 1)
+
+def estimate_coin_tx_vsize(utxos: List[IUtxo], to: List[ISendToAddress], change: str):
+    """
+    Estimates the vsize of the transaction built by create_coin_psbt.
+    """
+    total_input = sum(utxo.satoshis for utxo in utxos)
+    addresses = [item.address for item in to]
+    if not (len(to) == 1 and to[0].amount == total_input):
+        addresses.append(change)
+    return tx_vsize([pay_input_weight(utxo) for utxo in utxos],
+                    [output_weight(address) for address in addresses])
+
+def estimate_p2tr_note_tx_vsize(payload: NotePayload,
+                                note_utxos: List[IUtxo],
+                                pay_utxos: List[IUtxo],
+                                to_addresses: List[ISendToAddress],
+                                change: str):
+    """
+    Estimates the vsize of the transaction built by create_p2tr_note_psbt.
+    """
+    input_weights = p2tr_note_input_weights(payload, note_utxos)
+    input_weights += [pay_input_weight(utxo) for utxo in pay_utxos]
+    addresses = [to.address for to in to_addresses] + [change]
+    return tx_vsize(input_weights, [output_weight(address) for address in addresses])
+
+def estimate_p2tr_commit_note_tx_vsize(payload: NotePayload,
+                                       pay_utxos: List[IUtxo],
+                                       to: ISendToAddress,
+                                       change: str):
+    """
+    Estimates the vsize of the transaction built by create_p2tr_commit_note_psbt.
+    """
+    input_weights = [commit_note_input_weight(payload)]
+    input_weights += [pay_input_weight(utxo) for utxo in pay_utxos]
+    return tx_vsize(input_weights, [output_weight(to.address), output_weight(change)])
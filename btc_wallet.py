@@ -1,6 +1,6 @@
 from typing import List, Dict
+import asyncio
 import time
-import requests
 import msgpack
 from bitcoinutils.keys import PrivateKey
 from bitcoinutils.setup import setup
@@ -12,17 +12,44 @@ from btc_address import generate_p2wpkh_address, generate_p2tr_note_address, gen
 from btc_coin_tx import create_coin_psbt
 from btc_p2tr_note import create_p2tr_note_psbt
 from btc_p2tr_commit_note import create_p2tr_commit_note_psbt
+from btc_mint_engine import MintEngine
+from btc_coin_select import spent_utxos, paid_fee
 from wallet import Wallet
 from btc_tweak import tweak_key_pair
+from btc_fee_oracle import build_fee_oracle
 from config import MIN_SATOSHIS
 
 
+def btc_account_record(private_key, public_key, testnet):
+    """
+    Returns the tweaked key pair and the main and token addresses of an account
+    as a flat tuple, cheap to send back from derivation worker processes.
+    """
+    tweaked_private_key, x_only_pubkey = tweak_key_pair(private_key, public_key, testnet)
+    network = 'testnet' if testnet else 'mainnet'
+    main_address = generate_p2wpkh_address(public_key, network)
+    token_address = generate_p2tr_note_address(public_key, network)
+    return (tweaked_private_key, x_only_pubkey,
+            main_address.address, main_address.script, main_address.script_hash,
+            token_address.address, token_address.script, token_address.script_hash)
+
+
+# Urchain polls for a funding output missing from the funding transaction
+COMMIT_UTXO_POLL_ATTEMPTS = 10
+
+
 class BTCWallet(Wallet):
+    # Sign and serialize transactions directly instead of through PSBTs
+    raw_tx = True
+
     def __init__(self, mnemonic, config, lang="ENGLISH"):
         self.mnemonic = mnemonic
         self.config = config
         self.lang = lang
         super().__init__(mnemonic, config, lang)
+        self.fee_oracle = build_fee_oracle(config.fees, self.urchain, config.network == 'testnet')
+        # Warm the fee cache so that building the first transaction does not wait on it
+        self.fee_oracle.prefetch()
 
     def info(self):
         return {
@@ -38,24 +65,44 @@ class BTCWallet(Wallet):
             "currentAccount": self.current_account,
         }
 
-    def create_account(self, root, root_path1, root_path2, index, target):
-        account = super().create_account(root, root_path1, root_path2, index, target)
-
-        tweaked_key_pair = tweak_key_pair(
-                                account.private_key,
-                                account.public_key,
-                                self.config.network == 'testnet')
-        account.tweaked_private_key = tweaked_key_pair[0]
-        account.x_only_pubkey = tweaked_key_pair[1]
-        network = 'testnet' if self.config.network == 'testnet' else 'mainnet'
-        account.main_address = generate_p2wpkh_address(account.public_key, network)
-        account.token_address = generate_p2tr_note_address(account.public_key, network)
+    account_record = staticmethod(btc_account_record)
+
+    def apply_account_record(self, account, record):
+        account.tweaked_private_key = record[0]
+        return self.apply_public_record(account, record[1:])
+
+    def public_account_record(self, account):
+        return (account.x_only_pubkey,
+                account.main_address.address, account.main_address.script, account.main_address.script_hash,
+                account.token_address.address, account.token_address.script, account.token_address.script_hash)
+
+    def apply_public_record(self, account, record):
+        (account.x_only_pubkey,
+         main_address, main_script, main_script_hash,
+         token_address, token_script, token_script_hash) = record
+        account.main_address = IAddressObject(address=main_address,
+                                              script=main_script,
+                                              script_hash=main_script_hash,
+                                              type=AddressType.P2WPKH)
+        account.token_address = IAddressObject(address=token_address,
+                                               script=token_script,
+                                               script_hash=token_script_hash,
+                                               type=AddressType.P2TR_NOTE)
         return account
 
+    def init_private_fields(self, account):
+        account.tweaked_private_key, _ = tweak_key_pair(account.private_key,
+                                                        account.public_key,
+                                                        self.config.network == 'testnet')
+
     def get_balance(self):
-        main_address_balance = self.urchain.balance(self.current_account.main_address.script_hash)
-        token_address_balance = self.urchain.balance(self.current_account.token_address.script_hash)
+        main_script_hash = self.current_account.main_address.script_hash
+        token_script_hash = self.current_account.token_address.script_hash
+        balances = self.urchain.balances([main_script_hash, token_script_hash])
+        return self._format_balance(balances[main_script_hash], balances[token_script_hash])
 
+    @staticmethod
+    def _format_balance(main_address_balance, token_address_balance):
         return {
             "mainAddress": {
                 "confirmed": main_address_balance['confirmed'],
@@ -68,40 +115,55 @@ class BTCWallet(Wallet):
         }
 
     def send(self, to_addresses: ISendToAddress):
+        return self._send(to_addresses)[1]
+
+    def _send(self, to_addresses: ISendToAddress):
+        """
+        Builds and broadcasts a payment, returns the transaction and the broadcast result.
+        """
         utxos = self.fetch_all_account_utxos()
         fee_rate = self.get_fee_per_kb()
+        final_tx = self._build_send_tx(to_addresses, utxos, fee_rate['avgFee'])
+        tx_hex = final_tx.serialize(include_witness=True)
+        result = self.urchain.broadcast(tx_hex)
+        self._track_broadcast(tx_hex, result)
+        return final_tx, result
+
+    def _build_send_tx(self, to_addresses: ISendToAddress, utxos: List[IUtxo], fee_rate):
         network = 'testnet' if self.config.network == 'testnet' else 'mainnet'
 
         setup(network)
         private_key = PrivateKey(self.current_account.private_key)
-        estimated_psbt = create_coin_psbt(
-            private_key,
-            utxos,
-            to_addresses,
-            self.current_account.main_address.address,
-            network,
-            fee_rate['avgFee'],
-            1000
-        )
 
-        estimated_size = estimated_psbt.vsize
-        real_fee = int((estimated_size * fee_rate['avgFee']) / 1000 + 1)
-
-        final_tx = create_coin_psbt(
+        return create_coin_psbt(
             private_key,
             utxos,
             to_addresses,
             self.current_account.main_address.address,
             network,
-            fee_rate['avgFee'],
-            real_fee
+            fee_rate,
+            raw=self.raw_tx
         )
 
-        return self.urchain.broadcast(final_tx.serialize(include_witness=True).hex())
-
     def send_token(self, to_address: str, tick: str, amt: int) -> Dict[str, Any]:
         token_utxos = self.get_token_utxos(tick, amt)
         missed_token_utxos = self.urchain.tokenutxos([self.current_account.main_address.script_hash], tick)
+        pay_utxos = self.fetch_all_account_utxos()
+
+        transfer_data, tx = self._build_token_transfer(to_address, tick, amt, token_utxos,
+                                                       missed_token_utxos, pay_utxos)
+        result = self.broadcast_transaction(tx)
+
+        return {
+            'transferData': transfer_data,
+            'result': result,
+        }
+
+    def _build_token_transfer(self, to_address: str, tick: str, amt: int,
+                              token_utxos: List[ITokenUtxo],
+                              missed_token_utxos: List[ITokenUtxo],
+                              pay_utxos: List[IUtxo],
+                              fee_rate=None):
         missed_balance = sum(int(utxo.amount) for utxo in missed_token_utxos)
         balance = missed_balance + sum(int(utxo.amount) for utxo in token_utxos)
 
@@ -120,8 +182,6 @@ class BTCWallet(Wallet):
             'amt':amt,
         }
 
-        pay_utxos = self.fetch_all_account_utxos()
-
         if missed_token_utxos:
             for utxo in missed_token_utxos:
                 utxo.private_key_wif = self.current_account.private_key
@@ -131,13 +191,8 @@ class BTCWallet(Wallet):
         payload = self.build_n20_payload(transfer_data)
         if payload.locktime is None:
             payload.locktime = 0
-        tx = self.build_n20_transaction(payload, to_addresses, token_utxos, pay_utxos)
-        result = self.broadcast_transaction(tx)
-
-        return {
-            'transferData': transfer_data,
-            'result': result,
-        }
+        tx = self.build_n20_transaction(payload, to_addresses, token_utxos, pay_utxos, fee_rate)
+        return transfer_data, tx
 
     def build_n20_transaction(self,
                               payload:NotePayload,
@@ -154,21 +209,6 @@ class BTCWallet(Wallet):
         setup(network)
         private_key = PrivateKey(self.current_account.private_key)
 
-        estimated_psbt = create_p2tr_note_psbt(
-            private_key,
-            payload,
-            note_utxos,
-            pay_utxos,
-            to_addresses,
-            self.current_account.main_address.address,
-            network,
-            fee_rate,
-            1000
-        )
-        estimated_size = estimated_psbt.vsize
-
-        real_fee = int((estimated_size * fee_rate) / 1000 + 1)
-
         final_tx = create_p2tr_note_psbt(
             private_key,
             payload,
@@ -178,24 +218,28 @@ class BTCWallet(Wallet):
             self.current_account.main_address.address,
             network,
             fee_rate,
-            real_fee
+            raw=self.raw_tx
         )
+        pay_utxos = spent_utxos(final_tx, pay_utxos)
         return ITransaction(
             tx_id=final_tx.id,
             tx_hex=final_tx.serialize(include_witness=True),
             note_utxos=note_utxos,
             pay_utxos=pay_utxos,
-            fee_rate=fee_rate
+            fee_rate=fee_rate,
+            fee=paid_fee(final_tx, note_utxos + pay_utxos)
         )
 
     def broadcast_transaction(self, tx):
-        return self.urchain.broadcast(tx.tx_hex.hex())
+        result = self.urchain.broadcast(tx.tx_hex)
+        self._track_broadcast(tx.tx_hex, result)
+        return result
 
 
     def build_n20_payload(self, data, use_script_size=False):
         sorted_data = sort_dict_by_key(data)
         encoded_data = msgpack.packb(sorted_data)
-        payload = NotePayload("", "", "", "", "")
+        payload = NotePayload(b"", b"", b"", b"", b"")
         buffer = bytearray(encoded_data)
 
         if len(buffer) <= MAX_STACK_FULL_SIZE:
@@ -207,7 +251,7 @@ class BTCWallet(Wallet):
 
         i = 0
         for item in data_list:
-            setattr(payload, f"data{i}", item.hex())
+            setattr(payload, f"data{i}", item)
             i += 1
         return payload
 
@@ -220,6 +264,35 @@ class BTCWallet(Wallet):
         )
         return address
 
+    def _fund_commit_address(self, commit_address: IAddressObject) -> IUtxo:
+        """
+        Sends MIN_SATOSHIS to the commit address and returns the funding output.
+
+        The UTXO is built from the funding transaction, so it can be spent right
+        away. Urchain is only polled if the output cannot be found in it.
+        """
+        final_tx, result = self._send([ISendToAddress(address=commit_address.address,
+                                                      amount=MIN_SATOSHIS)])
+        if not result['success']:
+            raise Exception(result.get('error'))
+        tx_id = final_tx.id.hex()
+        for index, tx_out in enumerate(final_tx.vout):
+            if tx_out.script_pub_key.script == commit_address.script:
+                return IUtxo(tx_id=tx_id,
+                             output_index=index,
+                             satoshis=tx_out.value,
+                             script=commit_address.script,
+                             script_hash=commit_address.script_hash,
+                             type=commit_address.type,
+                             private_key_wif=None)
+
+        for _ in range(COMMIT_UTXO_POLL_ATTEMPTS):
+            note_utxos = self.urchain.utxos([commit_address.script_hash])
+            if len(note_utxos) > 0:
+                return note_utxos[0]
+            time.sleep(1)
+        raise Exception("Cannot get commit note UTXO")
+
     def build_n20_payload_transaction(self,
                                       payload:NotePayload,
                                       to_address:ISendToAddress=None,
@@ -229,20 +302,7 @@ class BTCWallet(Wallet):
         if note_utxo is None:
             commit_address = self.current_account.token_address
             note_utxos = self.urchain.utxos([commit_address.script_hash])
-            if len(note_utxos) == 0:
-                result = self.send([ISendToAddress(address=commit_address.address,
-                                                   amount=MIN_SATOSHIS)])
-                if result['success']:
-                    for _ in range(10):
-                        note_utxos = self.urchain.utxos([commit_address.script_hash])
-                        if len(note_utxos) > 0:
-                            break
-                        time.sleep(1)
-                    else:
-                        raise Exception("Cannot get commit note UTXO")
-                else:
-                    raise Exception(result['error'])
-            note_utxo = note_utxos[0]
+            note_utxo = note_utxos[0] if note_utxos else self._fund_commit_address(commit_address)
             note_utxo.type = AddressType.P2TR_NOTE
 
         if pay_utxos is None:
@@ -260,6 +320,33 @@ class BTCWallet(Wallet):
         return result
 
 
+    def build_n20_mint_engine(self,
+                              payload:NotePayload,
+                              to_address:str,
+                              note_utxo:IUtxo=None,
+                              pay_utxos:List[IUtxo]=None,
+                              fee_rate=None):
+        """
+        Builds the payload transaction once and returns a MintEngine that re-signs
+        it for other locktimes, together with the transaction for payload.locktime.
+        """
+        tx = self.build_n20_payload_transaction(payload, to_address, note_utxo, pay_utxos, fee_rate)
+
+        network = 'testnet' if self.config.network == 'testnet' else 'mainnet'
+        setup(network)
+        engine = MintEngine(
+            PrivateKey(self.current_account.private_key),
+            payload,
+            tx.note_utxos,
+            tx.pay_utxos,
+            [ISendToAddress(address=to_address, amount=MIN_SATOSHIS)],
+            self.current_account.main_address.address,
+            network,
+            tx.fee,
+            tx.fee_rate
+        )
+        return engine, tx
+
     def build_commit_payload_transaction(self,
                                          payload:NotePayload,
                                          to_address:ISendToAddress=None,
@@ -269,20 +356,7 @@ class BTCWallet(Wallet):
         commit_address = self.commit_payload_address(payload)
         if note_utxo is None:
             note_utxos = self.urchain.utxos([commit_address.script_hash])
-            if len(note_utxos) == 0:
-                result = self.send([ISendToAddress(address=commit_address.address,
-                                                   amount=MIN_SATOSHIS)])
-                if result['success']:
-                    for _ in range(10):
-                        note_utxos = self.urchain.utxos([commit_address.script_hash])
-                        if len(note_utxos) > 0:
-                            break
-                        time.sleep(1)
-                    else:
-                        raise Exception("Cannot get commit note UTXO")
-                else:
-                    raise Exception(result.error)
-            note_utxo = note_utxos[0]
+            note_utxo = note_utxos[0] if note_utxos else self._fund_commit_address(commit_address)
             note_utxo.type = "P2TR-COMMIT-NOTE"
 
         if to_address is None:
@@ -299,21 +373,6 @@ class BTCWallet(Wallet):
         setup(network)
         private_key = PrivateKey(self.current_account.private_key)
 
-        estimated_psbt = create_p2tr_commit_note_psbt(
-            private_key,
-            payload,
-            note_utxo,
-            pay_utxos,
-            to,
-            self.current_account.main_address.address,
-            network,
-            fee_rate,
-            1000
-        )
-
-        estimated_size = estimated_psbt.vsize
-        real_fee = int((estimated_size * fee_rate) / 1000 + 1)
-        print("Estimated size: ", estimated_size, "Real fee: ", real_fee)
         final_tx = create_p2tr_commit_note_psbt(
             private_key,
             payload,
@@ -323,15 +382,19 @@ class BTCWallet(Wallet):
             self.current_account.main_address.address,
             network,
             fee_rate,
-            real_fee
+            raw=self.raw_tx
         )
+        pay_utxos = spent_utxos(final_tx, pay_utxos)
+        real_fee = paid_fee(final_tx, [note_utxo] + pay_utxos)
+        print("Size: ", final_tx.vsize, "Real fee: ", real_fee)
 
         return ITransaction(
             tx_id=final_tx.id,
             tx_hex=final_tx.serialize(include_witness=True),
-            note_utxos=note_utxos,
+            note_utxos=[note_utxo],
             pay_utxos=pay_utxos,
-            fee_rate=fee_rate
+            fee_rate=fee_rate,
+            fee=real_fee
         )
 
     def token_list(self):
@@ -340,16 +403,51 @@ class BTCWallet(Wallet):
 
 
     def get_fee_per_kb(self):
-        url = "https://mempool.space"
-        if self.config.network == 'testnet':
-            url += "/testnet4"
-        url += "/api/v1/fees/recommended"
-        response = requests.get(url, timeout=10)
-        if response.status_code != 200:
-            raise Exception(f"Cannot get fee rate, status code: {response.status_code} url: {url}")        
-        fees = response.json()
+        return self.fee_oracle.get()
+
+    # asyncio variants, independent requests are gathered concurrently
+
+    async def async_get_fee_per_kb(self):
+        if self.fee_oracle.cached():
+            return self.get_fee_per_kb()
+        return await asyncio.to_thread(self.get_fee_per_kb)
+
+    async def async_get_balance(self):
+        main_script_hash = self.current_account.main_address.script_hash
+        token_script_hash = self.current_account.token_address.script_hash
+        balances = await self.async_urchain.balances([main_script_hash, token_script_hash])
+        return self._format_balance(balances[main_script_hash], balances[token_script_hash])
+
+    async def async_send(self, to_addresses: ISendToAddress):
+        utxos, fee_rate = await asyncio.gather(self.async_fetch_all_account_utxos(),
+                                               self.async_get_fee_per_kb())
+        final_tx = self._build_send_tx(to_addresses, utxos, fee_rate['avgFee'])
+        tx_hex = final_tx.serialize(include_witness=True)
+        result = await self.async_urchain.broadcast(tx_hex)
+        self._track_broadcast(tx_hex, result)
+        return result
+
+    async def async_send_token(self, to_address: str, tick: str, amt: int) -> Dict[str, Any]:
+        token_utxos, missed_token_utxos, pay_utxos, fee_rate = await asyncio.gather(
+            self.async_get_token_utxos(tick, amt),
+            self.async_urchain.tokenutxos([self.current_account.main_address.script_hash], tick),
+            self.async_fetch_all_account_utxos(),
+            self.async_get_fee_per_kb())
+
+        transfer_data, tx = self._build_token_transfer(to_address, tick, amt, token_utxos,
+                                                       missed_token_utxos, pay_utxos,
+                                                       fee_rate['avgFee'])
+        result = await self.async_broadcast_transaction(tx)
+
         return {
-            "slowFee": min(fees['hourFee'], fees['halfHourFee']) * 1000,
-            "avgFee": max(fees['hourFee'], fees['halfHourFee']) * 1000,
-            "fastFee": max(fees['hourFee'], fees['halfHourFee'], fees['fastestFee']) * 1000
+            'transferData': transfer_data,
+            'result': result,
         }
+
+    async def async_broadcast_transaction(self, tx):
+        result = await self.async_urchain.broadcast(tx.tx_hex)
+        self._track_broadcast(tx.tx_hex, result)
+        return result
+
+    async def async_token_list(self):
+        return await self.async_urchain.token_list(self.current_account.token_address.script_hash)
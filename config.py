@@ -18,13 +18,25 @@ BTC_URCHAIN_HOST = os.getenv('BTC_URCHAIN_HOST', 'https://btc.urchain.com/api/')
 BTC_URCHAIN_HOST_TESTNET = \
     os.getenv('BTC_URCHAIN_HOST_TESTNET', 'https://btc-testnet4.urchain.com/api/').strip('"')
 
+# Secondary hosts for hedged requests, unset to disable hedging
+BTC_URCHAIN_HEDGE_HOST = os.getenv('BTC_URCHAIN_HEDGE_HOST', '').strip('"') or None
+
+BTC_URCHAIN_HEDGE_HOST_TESTNET = os.getenv('BTC_URCHAIN_HEDGE_HOST_TESTNET', '').strip('"') or None
+
+# JSON file of fee rates, used when the fee APIs cannot be reached
+BTC_FEE_FILE = os.getenv('BTC_FEE_FILE', '').strip('"') or None
+
+# Directory of the derived account caches, unset to derive every account on startup
+WALLET_ACCOUNT_CACHE_DIR = os.getenv('WALLET_ACCOUNT_CACHE_DIR', '').strip('"') or None
+
 
 class CoinConfig:
     """
     Coin configuration class.
     """
     def __init__(self, name, symbol, decimal, path_r, path_r_s1, path_r_s2, base_symbol, network, explorer, faucets,
-                  P2SH, P2PKH, P2WSH, P2TR, min_dust_threshold, bip21, urchain):
+                  P2SH, P2PKH, P2WSH, P2TR, min_dust_threshold, bip21, urchain, fees=None,
+                  account_cache_dir=None):
         self.name = name
         self.symbol = symbol
         self.decimal = decimal
@@ -42,6 +54,8 @@ class CoinConfig:
         self.min_dust_threshold = min_dust_threshold
         self.bip21 = bip21
         self.urchain = urchain
+        self.fees = fees or {}
+        self.account_cache_dir = account_cache_dir
 
 coins = [
     CoinConfig(
@@ -86,7 +100,29 @@ coins = [
         urchain={
             "host": BTC_URCHAIN_HOST,
             "apiKey": URCHAIN_KEY,
+            "timeout": 10,
+            "timeouts": {"broadcast": 30},
+            "retries": 3,
+            "hedgeHost": BTC_URCHAIN_HEDGE_HOST,
+            "hedgeDelay": 0.5,
+            "breakerThreshold": 5,
+            "breakerResetTimeout": 30,
+            "poolConnections": 2,
+            "poolMaxsize": 10,
+            "cache": True,
+            "chunkSize": 100,
+            "maxParallel": 4,
+        },
+        fees={
+            "sources": ["mempool", "urchain", "file"],
+            "ttl": 60,
+            "maxStale": 1800,
+            "mempoolUrl": "https://mempool.space/api",
+            "urchainCommand": None,
+            "file": BTC_FEE_FILE,
+            "timeout": 10,
         },
+        account_cache_dir=WALLET_ACCOUNT_CACHE_DIR,
     ),
     CoinConfig(
         name="Bitcoin",
@@ -126,6 +162,28 @@ coins = [
         urchain={
             "host": BTC_URCHAIN_HOST_TESTNET,
             "apiKey": URCHAIN_KEY,
+            "timeout": 10,
+            "timeouts": {"broadcast": 30},
+            "retries": 3,
+            "hedgeHost": BTC_URCHAIN_HEDGE_HOST_TESTNET,
+            "hedgeDelay": 0.5,
+            "breakerThreshold": 5,
+            "breakerResetTimeout": 30,
+            "poolConnections": 2,
+            "poolMaxsize": 10,
+            "cache": True,
+            "chunkSize": 100,
+            "maxParallel": 4,
+        },
+        fees={
+            "sources": ["mempool", "urchain", "file"],
+            "ttl": 60,
+            "maxStale": 1800,
+            "mempoolUrl": "https://mempool.space/testnet4/api",
+            "urchainCommand": None,
+            "file": BTC_FEE_FILE,
+            "timeout": 10,
         },
+        account_cache_dir=WALLET_ACCOUNT_CACHE_DIR,
     ),
 ]
\ No newline at end of file
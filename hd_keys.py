@@ -0,0 +1,73 @@
+"""
+Batch BIP32 private key derivation.
+
+bip32utils computes the public key of every node it creates with pure-Python
+EC arithmetic. Deriving account ranges only needs the public keys of the parent
+and of the leaf keys, so these helpers run the BIP32 CKDpriv step with hmac and
+get public keys from the libsecp256k1 loaded by bitcointx.
+"""
+from typing import Iterable, Iterator, Tuple
+import ctypes
+import hashlib
+import hmac
+import struct
+
+import base58
+from bitcointx.core.secp256k1 import get_secp256k1, SECP256K1_EC_COMPRESSED
+
+CURVE_ORDER = 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEBAAEDCE6AF48A03BBFD25E8CD0364141
+HARDENED = 0x80000000
+
+
+def pubkey_of(secret: bytes) -> bytes:
+    """
+    Returns the compressed public key of a 32-byte secret.
+    """
+    secp256k1 = get_secp256k1()
+    raw_pubkey = ctypes.create_string_buffer(64)
+    if secp256k1.lib.secp256k1_ec_pubkey_create(secp256k1.ctx.sign, raw_pubkey, secret) != 1:
+        raise ValueError("Invalid private key")
+    size = ctypes.c_size_t(33)
+    pubkey = ctypes.create_string_buffer(33)
+    secp256k1.lib.secp256k1_ec_pubkey_serialize(
+        secp256k1.ctx.sign, pubkey, ctypes.byref(size), raw_pubkey, SECP256K1_EC_COMPRESSED)
+    return pubkey.raw
+
+
+def ckd_priv(secret: bytes, chain_code: bytes, index: int, pubkey: bytes = None) -> Tuple[bytes, bytes]:
+    """
+    BIP32 CKDpriv, returns the secret and chain code of child `index`.
+
+    pubkey is the public key of `secret`, computed if not given and needed.
+    """
+    if index & HARDENED:
+        data = b'\0' + secret + struct.pack(">L", index)
+    else:
+        data = (pubkey or pubkey_of(secret)) + struct.pack(">L", index)
+    digest = hmac.new(chain_code, data, hashlib.sha512).digest()
+    tweak = int.from_bytes(digest[:32], 'big')
+    child = (tweak + int.from_bytes(secret, 'big')) % CURVE_ORDER
+    if tweak >= CURVE_ORDER or child == 0:
+        raise ValueError(f"Invalid child key at index {index}")
+    return child.to_bytes(32, 'big'), digest[32:]
+
+
+def derive_children(secret: bytes,
+                    chain_code: bytes,
+                    indexes: Iterable[int],
+                    target: int) -> Iterator[Tuple[int, bytes, bytes]]:
+    """
+    Yields (index, secret, pubkey) of the keys at index/target below the node.
+    """
+    pubkey = pubkey_of(secret)
+    for index in indexes:
+        index_secret, index_chain_code = ckd_priv(secret, chain_code, index, pubkey)
+        child_secret, _ = ckd_priv(index_secret, index_chain_code, target)
+        yield index, child_secret, pubkey_of(child_secret)
+
+
+def secret_to_wif(secret: bytes, testnet: bool = False) -> str:
+    """
+    Returns the compressed WIF of a secret.
+    """
+    return base58.b58encode_check((b'\xef' if testnet else b'\x80') + secret + b'\x01').decode()
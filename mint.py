@@ -1,16 +1,14 @@
 import sys
-from notes import hash256
+import time
+from btc_mint_engine import mine_locktime
+from urchain_transport import backoff_delay, is_retryable
+from notes import hash256, compile_bitwork
 from utils import string_to_hexstring
 
 MAX_LOCKTIME = 1000000
+BROADCAST_ATTEMPTS = 3
 
-def mint_token(wallet, tick, amount, bitwork='20'):
-    note_note = None
-    pay_notes = None
-    fee_rate = None
-    result = None
-    locktime = 0  # increase locktime to change TX
-
+def mint_token(wallet, tick, amount, bitwork='20', use_engine=True, workers=1):
     token_info = wallet.token_info(tick)
     if not token_info:
         return {
@@ -43,10 +41,80 @@ def mint_token(wallet, tick, amount, bitwork='20'):
     payload = wallet.build_n20_payload(mint_data)
     to_address = wallet.current_account.token_address.address
 
+    if use_engine and hasattr(wallet, 'build_n20_mint_engine'):
+        return _mint_with_engine(wallet, payload, to_address, bitwork, workers)
+    return _mint_with_builder(wallet, payload, to_address, bitwork)
+
+def _broadcast(wallet, tx):
+    """
+    Broadcasts the transaction, retrying with backoff on connection errors, timeouts
+    and server errors. Re-sending is safe as the raw transaction does not change.
+    """
+    for attempt in range(BROADCAST_ATTEMPTS):
+        try:
+            return wallet.broadcast_transaction(tx)
+        except Exception as error:
+            if not is_retryable(error) or attempt + 1 == BROADCAST_ATTEMPTS:
+                return {
+                    'success': False,
+                    'error': str(error),
+                }
+            time.sleep(backoff_delay(attempt))
+
+def _show_progress(locktime):
+    sys.stdout.write(str(locktime) + '\r')
+    sys.stdout.flush()
+
+def _mint_with_engine(wallet, payload, to_address, bitwork, workers=1):
+    """
+    Builds the transaction template once and only re-signs it per locktime,
+    optionally grinding locktime ranges on a pool of worker processes.
+    """
+    setattr(payload, "locktime", 0)
+    try:
+        engine, _ = wallet.build_n20_mint_engine(payload, to_address)
+    except Exception as error:
+        return {
+            'success': False,
+            'error': str(error),
+        }
+
+    if workers > 1:
+        locktime = mine_locktime(engine, bitwork, 0, MAX_LOCKTIME, workers,
+                                 progress=_show_progress)
+        if locktime is None:
+            return {
+                'success': False,
+                'error': "Failed to mint NotePow token",
+            }
+        return _broadcast(wallet, engine.build(locktime))
+
+    matches = compile_bitwork(bitwork)
+    locktime = 0  # increase locktime to change TX
+    while locktime < MAX_LOCKTIME:
+        if locktime % 1000 == 0:
+            _show_progress(locktime)
+        if matches(engine.hash256(locktime)):
+            return _broadcast(wallet, engine.transaction())
+        locktime += 1
+
+    return {
+        'success': False,
+        'error': "Failed to mint NotePow token",
+    }
+
+def _mint_with_builder(wallet, payload, to_address, bitwork):
+    """
+    Rebuilds the whole transaction for every locktime.
+    """
+    note_note = None
+    pay_notes = None
+    fee_rate = None
+    locktime = 0  # increase locktime to change TX
+
     while locktime < MAX_LOCKTIME:
         if locktime % 1000 == 0:
-            sys.stdout.write(str(locktime) + '\r')
-            sys.stdout.flush()
+            _show_progress(locktime)
         setattr(payload, "locktime", locktime)
         try:
             tx = wallet.build_n20_payload_transaction(
@@ -62,15 +130,7 @@ def mint_token(wallet, tick, amount, bitwork='20'):
             }
         tx_hash256 = hash256(tx.tx_hex)
         if tx_hash256.startswith(bitwork):
-            try:
-                result = wallet.broadcast_transaction(tx)
-            except Exception as error:
-                result = wallet.broadcast_transaction(tx)
-            locktime = 0
-            note_note = None
-            pay_notes = None
-            fee_rate = None
-            return result
+            return _broadcast(wallet, tx)
         else:
             note_note = tx.note_utxo
             pay_notes = tx.pay_utxos
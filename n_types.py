@@ -16,19 +16,31 @@ class AddressType(Enum):
     P2TR_NOTE = "P2TR-NOTE"
     P2TR_COMMIT_NOTE = "P2TR-COMMIT-NOTE"
 
+def _hex_bytes(value):
+    # Scripts and payloads are kept as bytes, they are shown as hex
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value).hex()
+    if isinstance(value, dict):
+        return {k: _hex_bytes(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_hex_bytes(v) for v in value]
+    return value
+
 class IDumpable:
+    __slots__ = ()
+
     def dump(self, exclude: Optional[List[str]] = None):
         pp = PrettyPrinter(indent=4)
         if exclude:
-            pp.pprint({k: v for k, v in asdict(self).items() if k not in exclude})
+            pp.pprint({k: _hex_bytes(v) for k, v in asdict(self).items() if k not in exclude})
         else:
-            pp.pprint(asdict(self))
+            pp.pprint(_hex_bytes(asdict(self)))
 
 
-@dataclass
+@dataclass(slots=True)
 class IAddressObject:
     address: Optional[str] = None
-    script: Optional[str] = None
+    script: Optional[bytes] = None
     script_hash: str = ""
     type: AddressType = AddressType.P2PKH
 
@@ -39,7 +51,7 @@ class IScriptObject:
     script_hash: str = ""
     type: AddressType = AddressType.P2PKH    
 
-@dataclass
+@dataclass(slots=True)
 class IWalletAccount(IDumpable):
     target: int
     index: int
@@ -55,19 +67,26 @@ class IWalletAccount(IDumpable):
 
 @dataclass
 class NotePayload:
-    data0: str
-    data1: str
-    data2: str
-    data3: str
-    data4: str
+    data0: bytes
+    data1: bytes
+    data2: bytes
+    data3: bytes
+    data4: bytes
     locktime: Optional[int] = None
 
-@dataclass
+    def segments(self) -> List[bytes]:
+        """
+        Returns the data segments as bytes, hex segments are converted.
+        """
+        return [bytes.fromhex(segment) if isinstance(segment, str) else segment
+                for segment in (self.data0, self.data1, self.data2, self.data3, self.data4)]
+
+@dataclass(slots=True)
 class IUtxo(IDumpable):
     tx_id: str
     output_index: int
     satoshis: int
-    script: str
+    script: bytes
     script_hash: str
     type: AddressType
     private_key_wif: Optional[str] = None
@@ -82,6 +101,7 @@ class ITransaction:
     note_utxos: Optional[List[IUtxo]] = None
     pay_utxos: Optional[List[IUtxo]] = None
     fee_rate: Optional[float] = None
+    fee: Optional[int] = None
 
 @dataclass
 class IBroadcastResult:
@@ -111,14 +131,14 @@ class IFees:
     avgFee: int  # about 30 minutes
     fastFee: int  # about 10 minutes
 
-@dataclass
+@dataclass(slots=True)
 class ITokenUtxo(IDumpable):
     tx_id: str
     output_index: int
     satoshis: int
     type: AddressType
     amount: int = 0
-    script: Optional[str] = None
+    script: Optional[bytes] = None
     script_hash: Optional[str] = None
     private_key_wif: Optional[str] = None
     tx_hex: Optional[str] = None
@@ -6,6 +6,7 @@ import shlex
 from dotenv import set_key
 from pprint import pprint
 from btc_wallet import BTCWallet
+from wallet import DEFAULT_GAP_LIMIT
 from config import WALLET_MNEMONIC, coins
 from n_types import ISendToAddress
 from mint import mint_token
@@ -22,25 +23,32 @@ class CommandLineWallet(cmd.Cmd):
     def __init__(self):
         super().__init__()
         self.wallets = {}
+        self.wallet_configs = {}
         self.current_wallet = None
         self.init_wallets()
 
     def init_wallets(self):
-        print("Initializing wallets...")
+        """
+        Registers the wallet of each network, they are created on first use.
+        """
         for coin in coins:
             if coin.symbol == "BTC":
-                if coin.network == "livenet":
-                    self.wallets['BTClivenet'] = BTCWallet(self.mnemonic, coin)
-                    if self.wallets['BTClivenet'].mnemonic != self.mnemonic:
-                        self.mnemonic = self.wallets['BTClivenet'].mnemonic
-                    if len(coins) == 1:
-                        self.current_wallet = self.wallets['BTClivenet']
-                else:
-                    self.wallets['BTCtestnet'] = BTCWallet(self.mnemonic, coin)
-                    if self.wallets['BTCtestnet'].mnemonic != self.mnemonic:
-                        self.mnemonic = self.wallets['BTCtestnet'].mnemonic
+                self.wallet_configs['BTC' + coin.network] = coin
+        if len(self.wallet_configs) == 1:
+            self.current_wallet = self.get_wallet(next(iter(self.wallet_configs)))
         self.set_prompt()
 
+    def get_wallet(self, network):
+        wallet = self.wallets.get(network)
+        if wallet is None:
+            print(f"Initializing {network} wallet...")
+            wallet = BTCWallet(self.mnemonic, self.wallet_configs[network])
+            # A generated mnemonic is reused by the wallets of the other networks
+            if wallet.mnemonic != self.mnemonic:
+                self.mnemonic = wallet.mnemonic
+            self.wallets[network] = wallet
+        return wallet
+
     def set_prompt(self):
         if self.current_wallet:
             self.prompt = f"{self.current_wallet.config.network} " \
@@ -55,8 +63,8 @@ class CommandLineWallet(cmd.Cmd):
         try:
             parsed_args = parser.parse_args(shlex.split(args))
             network = 'BTC' + parsed_args.network
-            self.current_wallet = self.wallets[network]
-            if self.current_wallet:
+            if network in self.wallet_configs:
+                self.current_wallet = self.get_wallet(network)
                 print(f'Using {network} wallet')
                 self.set_prompt()
             else:
@@ -83,6 +91,23 @@ class CommandLineWallet(cmd.Cmd):
         except SystemExit:
             pass
 
+    def do_discover(self, args):
+        """discover [--gap-limit n] - find the accounts holding funds or tokens"""
+        parser = argparse.ArgumentParser(prog='discover', description='Find the used accounts of wallet')
+        parser.add_argument('--gap-limit', type=int, default=DEFAULT_GAP_LIMIT,
+                            help='Consecutive unused accounts after which discovery stops')
+        try:
+            parsed_args = parser.parse_args(shlex.split(args))
+            if not self.current_wallet:
+                print("No wallet selected")
+                return
+            accounts = self.current_wallet.discover_accounts(gap_limit=parsed_args.gap_limit)
+            pprint([account.ext_path for account in accounts])
+        except Exception as e:
+            print(e)
+        except SystemExit:
+            pass
+
     def do_balance(self, args):
         """balance - get wallet BTC balance"""
         if not self.current_wallet:
@@ -201,7 +226,7 @@ class CommandLineWallet(cmd.Cmd):
             pass
 
     def do_mint(self, args):
-        """mint [tick] [--amount amount_per_mint] [--loop loop_mint] [--bitwork bitwork] [--stop stop_on_fail] - mint token"""
+        """mint [tick] [--amount amount_per_mint] [--loop loop_mint] [--bitwork bitwork] [--stop stop_on_fail] [--workers workers] - mint token"""
         parser = argparse.ArgumentParser(prog='mint', description='Mint token')
 
         parser.add_argument('tick', type=str, help='Token tick')
@@ -209,6 +234,7 @@ class CommandLineWallet(cmd.Cmd):
         parser.add_argument('--loop', type=int, default=1, help='Number of successful minting, default=1')
         parser.add_argument('--bitwork', type=str, default='20', help='Bitwork, default=20')
         parser.add_argument('--stop', type=bool, default=False, help='Stop loop on fail, default=False')
+        parser.add_argument('--workers', type=int, default=1, help='Number of mining processes, default=1')
 
         try:
             parsed_args = parser.parse_args(shlex.split(args))
@@ -223,7 +249,8 @@ class CommandLineWallet(cmd.Cmd):
                     result = mint_token(self.current_wallet, 
                                         parsed_args.tick,
                                         parsed_args.amount,
-                                        parsed_args.bitwork)
+                                        parsed_args.bitwork,
+                                        workers=parsed_args.workers)
                     print(result)
                     if result['success']:
                         n += 1
@@ -1,7 +1,6 @@
 import hashlib
 import base64
 
-from bitcointx.core import x
 from bitcointx.core.script import OP_CHECKSIG, OP_2DROP, OP_FALSE, OP_CHECKSIGADD, OP_EQUAL, CScript
 from ecdsa import SigningKey, VerifyingKey, SECP256k1
 
@@ -13,18 +12,17 @@ def build_note_script(x_only_pubkey):
     Builds a NOTE script using the given x_only_pubkey.
 
     Parameters:
-    - x_only_pubkey: The x-only public key to be included in the NOTE script.
+    - x_only_pubkey (bytes): The x-only public key to be included in the NOTE script.
 
     Returns:
     - script: The constructed NOTE script.
 
     """
-    note_hex = NOTE_PROTOCOL_ENVELOPE_ID.encode().hex()
-    script = CScript([x(note_hex),
+    script = CScript([NOTE_PROTOCOL_ENVELOPE_ID.encode(),
                       OP_2DROP,
                       OP_2DROP,
                       OP_2DROP,
-                      x(x_only_pubkey),
+                      x_only_pubkey,
                       OP_CHECKSIG],
                     name='note_script')
     return script
@@ -35,21 +33,17 @@ def build_commit_note_script(payload, x_only_pubkey):
 
     Args:
         payload: The payload data for the NOTE script.
-        x_only_pubkey: The public key used for the NOTE script.
+        x_only_pubkey (bytes): The public key used for the NOTE script.
 
     Returns:
         The NOTE script as a CScript object.
     """
-    script = CScript([x(payload.data0) if payload.data0 else OP_FALSE,
-                      x(payload.data1) if payload.data1 else OP_FALSE,
-                      x(payload.data2) if payload.data2 else OP_FALSE,
-                      x(payload.data3) if payload.data3 else OP_FALSE,
-                      x(payload.data4) if payload.data4 else OP_FALSE,
-                      x(NOTE_PROTOCOL_ENVELOPE_ID.encode('utf-8').hex()),
+    script = CScript([segment if segment else OP_FALSE for segment in payload.segments()] +
+                     [NOTE_PROTOCOL_ENVELOPE_ID.encode('utf-8'),
                       OP_2DROP,
                       OP_2DROP,
                       OP_2DROP,
-                      x(x_only_pubkey),
+                      x_only_pubkey,
                       OP_CHECKSIG],
                 name='commit_note_script')
     return script
@@ -70,14 +64,14 @@ def build_note_muliti_sig_script(pubkeys, n):
     """
     assert n <= len(pubkeys), "n should be less than pubkeys.length"
     assert len(pubkeys) > 0, "pubkeys should not be empty"
-    script_asm = [x(NOTE_PROTOCOL_ENVELOPE_ID.encode('utf-8').hex()),
+    script_asm = [NOTE_PROTOCOL_ENVELOPE_ID.encode('utf-8'),
                   OP_2DROP,
                   OP_2DROP,
                   OP_2DROP,
-                  x(pubkeys[0].hex()),
+                  bytes(pubkeys[0]),
                   OP_CHECKSIG]
     for pubkey in pubkeys[1:]:
-        script_asm.append(x(pubkey.hex()))
+        script_asm.append(bytes(pubkey))
         script_asm.append(OP_CHECKSIGADD)
     script_asm.append(n)
     script_asm.append(OP_EQUAL)
@@ -89,6 +83,22 @@ def sha256ripemd160(content):
 def hash256(data):
     return hashlib.sha256(hashlib.sha256(data).digest()).hexdigest()
 
+def compile_bitwork(bitwork):
+    """
+    Compiles a hex bitwork prefix into a predicate on raw hash256 digests.
+
+    Args:
+        bitwork: The hex string the hex digest of the transaction must start with.
+
+    Returns:
+        A function that takes the 32-byte digest and returns whether it matches.
+    """
+    prefix = bytes.fromhex(bitwork[:len(bitwork) // 2 * 2])
+    if len(bitwork) % 2 == 0:
+        return lambda digest: digest.startswith(prefix)
+    nibble = int(bitwork[-1], 16)
+    return lambda digest: digest.startswith(prefix) and digest[len(prefix)] >> 4 == nibble
+
 def sign_content(content, private_key):
     sk = SigningKey.from_string(private_key, curve=SECP256k1)
     signature = sk.sign(content)
@@ -0,0 +1,75 @@
+import unittest
+
+from btclib.tx.out_point import OutPoint
+from btclib.tx.tx import Tx
+from btclib.tx.tx_in import TxIn
+from btclib.tx.tx_out import TxOut
+
+from n_types import AddressType, IUtxo
+from utxo_set import UtxoSet
+
+OWNED_SCRIPT = bytes.fromhex('0014') + bytes(range(20))
+OTHER_SCRIPT = bytes.fromhex('0014') + bytes(20)
+
+
+def owned(tx_id, output_index, satoshis):
+    return IUtxo(tx_id=tx_id, output_index=output_index, satoshis=satoshis,
+                 script=OWNED_SCRIPT, script_hash='owned', type=AddressType.P2WPKH)
+
+
+def spend(tx_id, output_index, outputs):
+    return Tx(version=2,
+              vin=[TxIn(OutPoint(bytes.fromhex(tx_id), output_index), b'', 0xffffffff)],
+              vout=[TxOut(value, script) for value, script in outputs])
+
+
+class UtxoSetTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.remote = []
+        self.utxo_set = UtxoSet(lambda: self.remote,
+                                lambda script: owned('', 0, 0) if script == OWNED_SCRIPT else None,
+                                reconcile_delay=None,
+                                clock=lambda: self.now)
+
+    def outpoints(self):
+        return {UtxoSet.outpoint(utxo) for utxo in self.utxo_set.utxos()}
+
+    def test_spent_change_stays_spent_when_its_transaction_confirms(self):
+        funding = owned('11' * 32, 0, 100000)
+        self.remote = [funding]
+        self.utxo_set.refresh()
+
+        tx1 = spend(funding.tx_id, 0, [(30000, OTHER_SCRIPT), (60000, OWNED_SCRIPT)])
+        self.utxo_set.apply_transaction(tx1.serialize(include_witness=False))
+        tx1_change = (tx1.id.hex(), 1)
+        tx2 = spend(*tx1_change, [(50000, OWNED_SCRIPT)])
+        self.utxo_set.apply_transaction(tx2.serialize(include_witness=False))
+        tx2_output = (tx2.id.hex(), 0)
+        self.assertEqual(self.outpoints(), {tx2_output})
+
+        # Urchain has not indexed tx1 yet
+        self.now += 1
+        self.utxo_set.refresh()
+        self.assertEqual(self.outpoints(), {tx2_output})
+
+        # Urchain reflects tx1 but not tx2
+        self.now += 1
+        self.remote = [owned(*tx1_change, 60000)]
+        self.utxo_set.refresh()
+        self.assertEqual(self.outpoints(), {tx2_output})
+
+    def test_local_updates_expire(self):
+        funding = owned('11' * 32, 0, 100000)
+        self.remote = [funding]
+        self.utxo_set.refresh()
+        tx = spend(funding.tx_id, 0, [(90000, OWNED_SCRIPT)])
+        self.utxo_set.apply_transaction(tx.serialize(include_witness=False))
+
+        self.now += self.utxo_set.pending_ttl
+        self.utxo_set.refresh()
+        self.assertEqual(self.outpoints(), {UtxoSet.outpoint(funding)})
+
+
+if __name__ == '__main__':
+    unittest.main()
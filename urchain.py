@@ -1,22 +1,65 @@
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 import requests
 import json
-from n_types import IUtxo, ITokenUtxo, AddressType
+from urchain_transport import HttpTransport, AsyncHttpTransport
+from urchain_cache import ResponseCache, BLOCK_BOUND_COMMANDS, MEMPOOL_BOUND_COMMANDS, MISSING
+from urchain_decode import decode_utxos, decode_token_utxos
+
+# Script hashes sent per utxos, token-utxos or balance request
+DEFAULT_CHUNK_SIZE = 100
+# Chunk requests in flight at once
+DEFAULT_MAX_PARALLEL = 4
+
+
+def _chunks(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def _utxos_request(script_hashs, _satoshis=None):
+    data = {"scriptHashs": script_hashs}
+    if _satoshis is not None:
+        data["satoshis"] = _satoshis
+    return data
+
+def _broadcast_request(raw_tx):
+    # Transactions are handled as bytes, the API takes them hex encoded
+    if isinstance(raw_tx, (bytes, bytearray, memoryview)):
+        raw_tx = bytes(raw_tx).hex()
+    return {"rawHex": raw_tx}
+
+def _tokenutxos_request(script_hashs, tick, amount=None):
+    data = {"scriptHashs": script_hashs, "tick": tick}
+    if amount is not None:
+        data["amount"] = amount
+    return data
 
 class Urchain:
-    def __init__(self, host, api_key="1234567890"):
-        self._http_client = requests.Session()
-        self._http_client.headers.update({
+    def __init__(self, host, api_key="1234567890", options=None):
+        """
+        Args:
+            host (str): The API host.
+            api_key (str, optional): The API key.
+            options (dict, optional): The transport and cache options of CoinConfig.urchain,
+                                      see urchain_transport and urchain_cache. chunkSize and
+                                      maxParallel split the script hash lists of batch lookups
+                                      into chunks fetched concurrently.
+        """
+        options = options or {}
+        self._transport = HttpTransport(host, {
             'Authorization': f'Bearer {api_key}',
             'Content-Type': 'application/json'
-        })
+        }, options)
+        self._http_client = self._transport.session
         self._base_url = host
+        self.cache = ResponseCache(options.get('cacheTtls')) if options.get('cache', True) else None
+        self.chunk_size = options.get('chunkSize', DEFAULT_CHUNK_SIZE)
+        self.max_parallel = options.get('maxParallel', DEFAULT_MAX_PARALLEL)
+        self._executor = None
 
-    def _get(self, command, params=None):
-        params = params or {}
+    def _request(self, method, command, **kwargs):
         try:
-            response = self._http_client.get(f'{self._base_url}/{command}', params=params)
-            response.raise_for_status()
-            return response.json()
+            return self._transport.request(method, command, **kwargs)
         except requests.HTTPError as http_err:
             print(f'HTTP error occurred: {http_err}')
             raise
@@ -24,18 +67,36 @@ class Urchain:
             print(f'Other error occurred: {err}')
             raise
 
-    def _post(self, command, data=None):
-        data = data or {}
-        try:
-            response = self._http_client.post(f'{self._base_url}/{command}', data=json.dumps(data))
-            response.raise_for_status()
-            return response.json()
-        except requests.HTTPError as http_err:
-            print(f'HTTP error occurred: {http_err}')
-            raise
-        except Exception as err:
-            print(f'Other error occurred: {err}')
-            raise
+    def _get(self, command, params=None):
+        return self._request('GET', command, params=params or {})
+
+    def _post(self, command, data=None, decode=None):
+        if self.cache is None or not self.cache.caches(command):
+            return self._request('POST', command, data=json.dumps(data or {}), decode=decode)
+        if command in BLOCK_BOUND_COMMANDS and self.cache.tip_expired():
+            try:
+                self.best_block()
+            except Exception:
+                pass  # the TTL still bounds how stale the response can be
+        value = self.cache.get(command, data)
+        if value is MISSING:
+            value = self._request('POST', command, data=json.dumps(data or {}), decode=decode)
+            self.cache.put(command, data, value)
+        return value
+
+    def cache_stats(self):
+        return self.cache.stats() if self.cache is not None else None
+
+    def _map(self, fetch, items):
+        """
+        Calls fetch on each item, at most max_parallel at once, and yields the
+        results in order as they arrive.
+        """
+        if len(items) <= 1 or self.max_parallel <= 1:
+            return map(fetch, items)
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_parallel)
+        return self._executor.map(fetch, items)
 
     def health(self):
         return self._get("health")
@@ -43,44 +104,45 @@ class Urchain:
     def balance(self, script_hash):
         return self._post("balance", {"scriptHash": script_hash})
 
+    def balances(self, script_hashs):
+        """
+        Returns the balances of script_hashs by script hash.
+        """
+        return dict(zip(script_hashs, self._map(self.balance, script_hashs)))
+
     def utxos(self, script_hashs, _satoshis=None):
-        data = {"scriptHashs": script_hashs}
+        # The server selects UTXOs covering _satoshis across all the script hashes
         if _satoshis is not None:
-            data["satoshis"] = _satoshis
-        utxos_data = self._post("utxos", data)
+            return self._post("utxos", _utxos_request(script_hashs, _satoshis), decode=decode_utxos)
         result = []
-        for utxo in utxos_data:
-            if 'privateKeyWif' not in utxo:
-                utxo['privateKeyWif'] = None
-            result.append(IUtxo(
-                            tx_id=utxo['txId'],
-                            output_index=utxo['outputIndex'],
-                            script_hash=utxo['scriptHash'],
-                            script=utxo['script'],
-                            satoshis=utxo['satoshis'],
-                            private_key_wif=utxo['privateKeyWif'],
-                            type=AddressType(utxo['type'])
-                        ))
+        for utxos in self.iter_utxos(script_hashs):
+            result.extend(utxos)
         return result
 
+    def iter_utxos(self, script_hashs):
+        """
+        Yields the UTXOs of script_hashs chunk by chunk, so large holdings can be
+        consumed without building one list of every UTXO.
+        """
+        return self._map(lambda chunk: self._post("utxos", _utxos_request(chunk), decode=decode_utxos),
+                         _chunks(script_hashs, self.chunk_size))
+
     def tokenutxos(self, script_hashs, tick, amount=None):
-        data = {"scriptHashs": script_hashs, "tick": tick}
         if amount is not None:
-            data["amount"] = amount
-        utxos_data = self._post("token-utxos", data)
+            return self._post("token-utxos", _tokenutxos_request(script_hashs, tick, amount),
+                              decode=decode_token_utxos)
         result = []
-        for utxo in utxos_data:
-            result.append(ITokenUtxo(
-                            tx_id=utxo['txId'],
-                            output_index=utxo['outputIndex'],
-                            satoshis=utxo['satoshis'],
-                            amount=utxo['amount'],
-                            type=AddressType.P2TR_NOTE
-                        ))
+        for utxos in self._map(lambda chunk: self._post("token-utxos", _tokenutxos_request(chunk, tick),
+                                                        decode=decode_token_utxos),
+                               _chunks(script_hashs, self.chunk_size)):
+            result.extend(utxos)
         return result
 
-    def broadcast(self, raw_hex):
-        return self._post("broadcast", {"rawHex": raw_hex})
+    def broadcast(self, raw_tx):
+        result = self._post("broadcast", _broadcast_request(raw_tx))
+        if self.cache is not None:
+            self.cache.invalidate(MEMPOOL_BOUND_COMMANDS)
+        return result
 
     def best_block(self):
         return self._post("best-header")
@@ -90,6 +152,139 @@ class Urchain:
     
     def token_list(self, script_hash):
         return self._post("token-list", {"scriptHash": script_hash})
+
+    def token_lists(self, script_hashs):
+        """
+        Returns the token lists of script_hashs by script hash.
+        """
+        return dict(zip(script_hashs, self._map(self.token_list, script_hashs)))
     
     def all_tokens(self):
         return self._post("all-n20-tokens")
+
+    def fee_rates(self, command):
+        """
+        Returns the fee rates served by the Urchain `command` of a deployment
+        exposing one.
+        """
+        return self._post(command)
+
+
+class AsyncUrchain:
+    """
+    asyncio counterpart of Urchain with the same methods as coroutines.
+
+    Requests share one aiohttp session, so independent calls can be gathered and
+    run concurrently. aiohttp is only imported when the first request is made.
+    """
+    def __init__(self, host, api_key="1234567890", options=None):
+        options = options or {}
+        self._transport = AsyncHttpTransport(host, {
+            'Authorization': f'Bearer {api_key}',
+            'Content-Type': 'application/json'
+        }, options)
+        self._base_url = host
+        self.cache = ResponseCache(options.get('cacheTtls')) if options.get('cache', True) else None
+        self.chunk_size = options.get('chunkSize', DEFAULT_CHUNK_SIZE)
+        self.max_parallel = options.get('maxParallel', DEFAULT_MAX_PARALLEL)
+
+    async def close(self):
+        await self._transport.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def _request(self, method, command, **kwargs):
+        try:
+            return await self._transport.request(method, command, **kwargs)
+        except Exception as err:
+            if getattr(err, 'status', None) is not None:
+                print(f'HTTP error occurred: {err}')
+            else:
+                print(f'Other error occurred: {err}')
+            raise
+
+    async def _get(self, command, params=None):
+        return await self._request('GET', command, params=params or {})
+
+    async def _post(self, command, data=None, decode=None):
+        if self.cache is None or not self.cache.caches(command):
+            return await self._request('POST', command, data=json.dumps(data or {}), decode=decode)
+        if command in BLOCK_BOUND_COMMANDS and self.cache.tip_expired():
+            try:
+                await self.best_block()
+            except Exception:
+                pass  # the TTL still bounds how stale the response can be
+        value = self.cache.get(command, data)
+        if value is MISSING:
+            value = await self._request('POST', command, data=json.dumps(data or {}), decode=decode)
+            self.cache.put(command, data, value)
+        return value
+
+    def cache_stats(self):
+        return self.cache.stats() if self.cache is not None else None
+
+    async def _gather(self, fetch, items):
+        """
+        Awaits fetch on each item, at most max_parallel at once, and returns the
+        results in order.
+        """
+        semaphore = asyncio.Semaphore(max(1, self.max_parallel))
+
+        async def fetch_item(item):
+            async with semaphore:
+                return await fetch(item)
+
+        return await asyncio.gather(*(fetch_item(item) for item in items))
+
+    async def health(self):
+        return await self._get("health")
+
+    async def balance(self, script_hash):
+        return await self._post("balance", {"scriptHash": script_hash})
+
+    async def balances(self, script_hashs):
+        return dict(zip(script_hashs, await self._gather(self.balance, script_hashs)))
+
+    async def utxos(self, script_hashs, _satoshis=None):
+        if _satoshis is not None:
+            return await self._post("utxos", _utxos_request(script_hashs, _satoshis), decode=decode_utxos)
+        chunks = await self._gather(lambda chunk: self._post("utxos", _utxos_request(chunk), decode=decode_utxos),
+                                    _chunks(script_hashs, self.chunk_size))
+        return [utxo for chunk in chunks for utxo in chunk]
+
+    async def tokenutxos(self, script_hashs, tick, amount=None):
+        if amount is not None:
+            return await self._post("token-utxos", _tokenutxos_request(script_hashs, tick, amount),
+                                    decode=decode_token_utxos)
+        chunks = await self._gather(lambda chunk: self._post("token-utxos", _tokenutxos_request(chunk, tick),
+                                                             decode=decode_token_utxos),
+                                    _chunks(script_hashs, self.chunk_size))
+        return [utxo for chunk in chunks for utxo in chunk]
+
+    async def broadcast(self, raw_tx):
+        result = await self._post("broadcast", _broadcast_request(raw_tx))
+        if self.cache is not None:
+            self.cache.invalidate(MEMPOOL_BOUND_COMMANDS)
+        return result
+
+    async def best_block(self):
+        return await self._post("best-header")
+
+    async def token_info(self, tick):
+        return await self._post("token-info", {"tick": tick})
+
+    async def token_list(self, script_hash):
+        return await self._post("token-list", {"scriptHash": script_hash})
+
+    async def token_lists(self, script_hashs):
+        return dict(zip(script_hashs, await self._gather(self.token_list, script_hashs)))
+
+    async def all_tokens(self):
+        return await self._post("all-n20-tokens")
+
+    async def fee_rates(self, command):
+        return await self._post(command)
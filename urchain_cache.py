@@ -0,0 +1,98 @@
+"""
+Response cache of the Urchain clients for read-mostly commands.
+
+Responses are kept for a per-command TTL. Token data only changes when a block
+is mined, so the block-bound commands are also dropped as soon as a best-header
+response reports a new tip. TTLs can be overridden through the cacheTtls entry
+of CoinConfig.urchain, and cache=False there disables the cache.
+"""
+from collections import Counter
+import json
+import time
+
+# Seconds a response stays fresh, by command
+DEFAULT_CACHE_TTLS = {
+    'best-header': 10,
+    'token-info': 600,
+    'token-list': 60,
+    'all-n20-tokens': 600,
+}
+# Commands whose responses only change when a block is mined
+BLOCK_BOUND_COMMANDS = frozenset({'token-info', 'token-list', 'all-n20-tokens'})
+# Commands whose responses change once a broadcast transaction is seen
+MEMPOOL_BOUND_COMMANDS = frozenset({'token-list'})
+
+MISSING = object()
+
+
+class ResponseCache:
+    """
+    TTL cache of decoded responses with hit and miss counters by command.
+
+    Cached responses are shared between callers and must not be mutated.
+    """
+    def __init__(self, ttls=None, clock=time.monotonic):
+        self.ttls = dict(DEFAULT_CACHE_TTLS, **(ttls or {}))
+        self.hits = Counter()
+        self.misses = Counter()
+        self.height = None
+        self._entries = {}
+        self._clock = clock
+
+    def caches(self, command):
+        return command in self.ttls
+
+    @staticmethod
+    def key(command, data):
+        return command, json.dumps(data or {}, sort_keys=True)
+
+    def _lookup(self, command, data):
+        entry = self._entries.get(self.key(command, data))
+        if entry is None or entry[0] <= self._clock():
+            return MISSING
+        return entry[1]
+
+    def get(self, command, data):
+        """
+        Returns the fresh response of the request, or MISSING.
+        """
+        value = self._lookup(command, data)
+        if value is MISSING:
+            self.misses[command] += 1
+        else:
+            self.hits[command] += 1
+        return value
+
+    def put(self, command, data, value):
+        if command == 'best-header':
+            self.update_height(value)
+        self._entries[self.key(command, data)] = (self._clock() + self.ttls[command], value)
+
+    def update_height(self, best_header):
+        """
+        Records the chain tip and drops the block-bound responses if it moved.
+        """
+        height = best_header.get('height', best_header) if isinstance(best_header, dict) else best_header
+        if self.height is not None and height != self.height:
+            self.invalidate(BLOCK_BOUND_COMMANDS)
+        self.height = height
+
+    def tip_expired(self):
+        """
+        Returns True if the cached best-header is stale and should be refetched.
+        """
+        return self._lookup('best-header', None) is MISSING
+
+    def invalidate(self, commands=None):
+        if commands is None:
+            self._entries.clear()
+        else:
+            self._entries = {key: entry for key, entry in self._entries.items() if key[0] not in commands}
+
+    def stats(self):
+        return {
+            'hits': dict(self.hits),
+            'misses': dict(self.misses),
+            'size': len(self._entries),
+            'height': self.height,
+        }
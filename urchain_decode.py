@@ -0,0 +1,97 @@
+"""
+Decoding of Urchain UTXO responses into IUtxo and ITokenUtxo records.
+
+Scripts are hex encoded in the responses and decoded to bytes here, the records
+keep them as bytes up to the transaction builders.
+
+The fastest available decoder is picked on import: msgspec decodes the response
+bytes straight into typed rows, orjson into dicts that are mapped in a single
+pass, and the json module is the fallback when neither is installed.
+"""
+from typing import Any, List, Optional
+import json
+
+from n_types import IUtxo, ITokenUtxo, AddressType
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# AddressType by value, cheaper than calling the enum per row
+_ADDRESS_TYPES = {address_type.value: address_type for address_type in AddressType}
+
+
+def _address_type(value):
+    address_type = _ADDRESS_TYPES.get(value)
+    return address_type if address_type is not None else AddressType(value)
+
+
+def parse_utxos(utxos_data) -> List[IUtxo]:
+    """
+    Builds IUtxo records from decoded utxos rows.
+    """
+    return [IUtxo(utxo['txId'],
+                  utxo['outputIndex'],
+                  utxo['satoshis'],
+                  bytes.fromhex(utxo['script']),
+                  utxo['scriptHash'],
+                  _address_type(utxo['type']),
+                  utxo.get('privateKeyWif'))
+            for utxo in utxos_data]
+
+
+def parse_token_utxos(utxos_data) -> List[ITokenUtxo]:
+    """
+    Builds ITokenUtxo records from decoded token-utxos rows.
+    """
+    return [ITokenUtxo(utxo['txId'],
+                       utxo['outputIndex'],
+                       utxo['satoshis'],
+                       AddressType.P2TR_NOTE,
+                       utxo['amount'])
+            for utxo in utxos_data]
+
+
+if msgspec is not None:
+    class _UtxoRow(msgspec.Struct, rename='camel'):
+        tx_id: str
+        output_index: int
+        satoshis: int
+        script: str
+        script_hash: str
+        type: AddressType
+        private_key_wif: Optional[str] = None
+
+    class _TokenUtxoRow(msgspec.Struct, rename='camel'):
+        tx_id: str
+        output_index: int
+        satoshis: int
+        amount: Any
+
+    _utxos_decoder = msgspec.json.Decoder(List[_UtxoRow], strict=False)
+    _token_utxos_decoder = msgspec.json.Decoder(List[_TokenUtxoRow], strict=False)
+
+    def decode_utxos(content: bytes) -> List[IUtxo]:
+        return [IUtxo(row.tx_id, row.output_index, row.satoshis, bytes.fromhex(row.script),
+                      row.script_hash, row.type, row.private_key_wif)
+                for row in _utxos_decoder.decode(content)]
+
+    def decode_token_utxos(content: bytes) -> List[ITokenUtxo]:
+        return [ITokenUtxo(row.tx_id, row.output_index, row.satoshis, AddressType.P2TR_NOTE, row.amount)
+                for row in _token_utxos_decoder.decode(content)]
+
+    loads = msgspec.json.decode
+else:
+    loads = orjson.loads if orjson is not None else json.loads
+
+    def decode_utxos(content: bytes) -> List[IUtxo]:
+        return parse_utxos(loads(content))
+
+    def decode_token_utxos(content: bytes) -> List[ITokenUtxo]:
+        return parse_token_utxos(loads(content))
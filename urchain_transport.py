@@ -0,0 +1,343 @@
+"""
+HTTP transport of the Urchain clients.
+
+Requests get per-endpoint timeouts, idempotent calls are retried with jittered
+exponential backoff, they can be hedged to a secondary host, and every host is
+guarded by a circuit breaker. The options are read from CoinConfig.urchain:
+
+    timeout              default read timeout in seconds
+    timeouts             read timeouts by command, e.g. {"broadcast": 30}
+    connectTimeout       connect timeout in seconds
+    retries              retries of idempotent calls
+    backoffBase          first backoff delay in seconds
+    backoffMax           backoff delay cap in seconds
+    hedgeHost            secondary API host, also used while the primary circuit is open
+    hedgeDelay           seconds to wait for the primary before hedging
+    breakerThreshold     consecutive failures that open the circuit of a host
+    breakerResetTimeout  seconds before an open circuit lets a trial request through
+    poolConnections      number of hosts to keep connection pools for
+    poolMaxsize          connections kept per host
+"""
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import asyncio
+import json
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_TIMEOUT = 10
+DEFAULT_CONNECT_TIMEOUT = 3.05
+DEFAULT_TIMEOUTS = {
+    'broadcast': 30,
+    'utxos': 20,
+    'token-utxos': 20,
+}
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF_BASE = 0.2
+DEFAULT_BACKOFF_MAX = 5.0
+DEFAULT_BREAKER_THRESHOLD = 5
+DEFAULT_BREAKER_RESET_TIMEOUT = 30.0
+DEFAULT_POOL_CONNECTIONS = 2
+DEFAULT_POOL_MAXSIZE = 10
+
+# Re-sending these may have side effects, the caller decides whether to retry
+NON_IDEMPOTENT_COMMANDS = frozenset({'broadcast'})
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised when the circuit of every host able to serve a request is open.
+    """
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failures and rejects requests until
+    `reset_timeout` seconds have passed, then lets one trial request through.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, threshold=DEFAULT_BREAKER_THRESHOLD,
+                 reset_timeout=DEFAULT_BREAKER_RESET_TIMEOUT, clock=time.monotonic):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = CircuitBreaker.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._clock = clock
+        # Hedged requests update the breaker from several threads
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """
+        Returns True if a request may be sent now. Only call it right before
+        sending one, as it may take the trial request slot of an open circuit.
+        """
+        with self._lock:
+            if self.state == CircuitBreaker.OPEN:
+                if self._clock() - self._opened_at < self.reset_timeout:
+                    return False
+                self.state = CircuitBreaker.HALF_OPEN
+                return True
+            # A half-open circuit has its trial request in flight
+            return self.state == CircuitBreaker.CLOSED
+
+    def record_success(self):
+        with self._lock:
+            self.state = CircuitBreaker.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == CircuitBreaker.HALF_OPEN or self.failures >= self.threshold:
+                self.state = CircuitBreaker.OPEN
+                self._opened_at = self._clock()
+
+    def release(self):
+        """
+        Frees the trial slot of a request abandoned without an outcome, so the
+        next request can be the trial.
+        """
+        with self._lock:
+            if self.state == CircuitBreaker.HALF_OPEN:
+                self.state = CircuitBreaker.OPEN
+
+
+def backoff_delay(attempt, base=DEFAULT_BACKOFF_BASE, maximum=DEFAULT_BACKOFF_MAX):
+    """
+    Returns the full-jitter exponential backoff delay before retry `attempt`.
+    """
+    return random.uniform(0, min(maximum, base * 2 ** attempt))
+
+
+class TransportOptions:
+    def __init__(self, options=None):
+        options = options or {}
+        self.timeout = options.get('timeout', DEFAULT_TIMEOUT)
+        self.timeouts = dict(DEFAULT_TIMEOUTS, **options.get('timeouts', {}))
+        self.connect_timeout = options.get('connectTimeout', DEFAULT_CONNECT_TIMEOUT)
+        self.retries = options.get('retries', DEFAULT_RETRIES)
+        self.backoff_base = options.get('backoffBase', DEFAULT_BACKOFF_BASE)
+        self.backoff_max = options.get('backoffMax', DEFAULT_BACKOFF_MAX)
+        self.hedge_host = options.get('hedgeHost')
+        self.hedge_delay = options.get('hedgeDelay')
+        self.breaker_threshold = options.get('breakerThreshold', DEFAULT_BREAKER_THRESHOLD)
+        self.breaker_reset_timeout = options.get('breakerResetTimeout', DEFAULT_BREAKER_RESET_TIMEOUT)
+        self.pool_connections = options.get('poolConnections', DEFAULT_POOL_CONNECTIONS)
+        self.pool_maxsize = options.get('poolMaxsize', DEFAULT_POOL_MAXSIZE)
+
+    def read_timeout(self, command):
+        return self.timeouts.get(command, self.timeout)
+
+    def attempts(self, command):
+        return 1 if command in NON_IDEMPOTENT_COMMANDS else self.retries + 1
+
+    def backoff(self, attempt):
+        return backoff_delay(attempt, self.backoff_base, self.backoff_max)
+
+
+def is_retryable(error):
+    """
+    Returns True for connection errors, timeouts and 429/5xx responses.
+    """
+    if isinstance(error, requests.HTTPError):
+        status = error.response.status_code if error.response is not None else None
+        return status is None or status == 429 or status >= 500
+    return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+
+class HttpTransport:
+    """
+    requests based transport of Urchain.
+    """
+    def __init__(self, host, headers, options=None):
+        self.options = TransportOptions(options)
+        self.hosts = [host] + ([self.options.hedge_host] if self.options.hedge_host else [])
+        self.breakers = [CircuitBreaker(self.options.breaker_threshold, self.options.breaker_reset_timeout)
+                         for _ in self.hosts]
+        self.session = requests.Session()
+        self.session.headers.update(headers)
+        adapter = HTTPAdapter(pool_connections=self.options.pool_connections,
+                              pool_maxsize=self.options.pool_maxsize)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._hedge_executor = None
+
+    def request(self, method, command, **kwargs):
+        """
+        Sends the request and returns the decoded JSON response, or the response
+        body passed through the decode keyword argument if given.
+        """
+        attempts = self.options.attempts(command)
+        for attempt in range(attempts):
+            try:
+                if len(self.hosts) > 1 and self.options.hedge_delay is not None and \
+                        command not in NON_IDEMPOTENT_COMMANDS:
+                    return self._hedged(method, command, **kwargs)
+                return self._failover(method, command, **kwargs)
+            except Exception as err:
+                if attempt + 1 == attempts or not is_retryable(err):
+                    raise
+                time.sleep(self.options.backoff(attempt))
+
+    def _failover(self, method, command, **kwargs):
+        for index in range(len(self.hosts)):
+            if self.breakers[index].allow():
+                return self._send(index, method, command, **kwargs)
+        raise CircuitOpenError(f'Circuit open for {command}')
+
+    def _send(self, index, method, command, decode=None, **kwargs):
+        breaker = self.breakers[index]
+        try:
+            response = self.session.request(
+                method, f'{self.hosts[index]}/{command}',
+                timeout=(self.options.connect_timeout, self.options.read_timeout(command)),
+                **kwargs)
+            response.raise_for_status()
+        except Exception as err:
+            if is_retryable(err):
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            raise
+        breaker.record_success()
+        return decode(response.content) if decode is not None else response.json()
+
+    def _hedged(self, method, command, **kwargs):
+        if self._hedge_executor is None:
+            self._hedge_executor = ThreadPoolExecutor(max_workers=2 * len(self.hosts))
+        # allow() is only asked of a host when a request is sent to it
+        hosts = iter(range(len(self.hosts)))
+        primary = next((index for index in hosts if self.breakers[index].allow()), None)
+        if primary is None:
+            raise CircuitOpenError(f'Circuit open for {command}')
+
+        pending = {self._hedge_executor.submit(self._send, primary, method, command, **kwargs)}
+        done, _ = wait(pending, timeout=self.options.hedge_delay)
+        if not done:
+            pending |= {self._hedge_executor.submit(self._send, index, method, command, **kwargs)
+                        for index in hosts if self.breakers[index].allow()}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+        raise error
+
+
+def _import_aiohttp():
+    try:
+        import aiohttp
+    except ImportError as err:
+        raise ImportError("AsyncUrchain requires aiohttp, install it with pip install -r requirements.txt") from err
+    return aiohttp
+
+
+def is_async_retryable(error):
+    aiohttp = _import_aiohttp()
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status == 429 or error.status >= 500
+    return isinstance(error, (aiohttp.ClientConnectionError, asyncio.TimeoutError))
+
+
+class AsyncHttpTransport:
+    """
+    aiohttp based transport of AsyncUrchain, with the same policies as HttpTransport.
+
+    aiohttp is imported when the session is first opened.
+    """
+    def __init__(self, host, headers, options=None):
+        self.options = TransportOptions(options)
+        self.hosts = [host] + ([self.options.hedge_host] if self.options.hedge_host else [])
+        self.breakers = [CircuitBreaker(self.options.breaker_threshold, self.options.breaker_reset_timeout)
+                         for _ in self.hosts]
+        self.headers = headers
+        self._session = None
+
+    def session(self):
+        if self._session is None or self._session.closed:
+            aiohttp = _import_aiohttp()
+            connector = aiohttp.TCPConnector(limit=self.options.pool_connections * self.options.pool_maxsize,
+                                             limit_per_host=self.options.pool_maxsize)
+            self._session = aiohttp.ClientSession(headers=self.headers, connector=connector)
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def request(self, method, command, **kwargs):
+        attempts = self.options.attempts(command)
+        for attempt in range(attempts):
+            try:
+                if len(self.hosts) > 1 and self.options.hedge_delay is not None and \
+                        command not in NON_IDEMPOTENT_COMMANDS:
+                    return await self._hedged(method, command, **kwargs)
+                return await self._failover(method, command, **kwargs)
+            except Exception as err:
+                if attempt + 1 == attempts or not is_async_retryable(err):
+                    raise
+                await asyncio.sleep(self.options.backoff(attempt))
+
+    async def _failover(self, method, command, **kwargs):
+        for index in range(len(self.hosts)):
+            if self.breakers[index].allow():
+                return await self._send(index, method, command, **kwargs)
+        raise CircuitOpenError(f'Circuit open for {command}')
+
+    async def _send(self, index, method, command, decode=None, **kwargs):
+        aiohttp = _import_aiohttp()
+        breaker = self.breakers[index]
+        timeout = aiohttp.ClientTimeout(sock_connect=self.options.connect_timeout,
+                                        total=self.options.connect_timeout + self.options.read_timeout(command))
+        try:
+            async with self.session().request(method, f'{self.hosts[index]}/{command}',
+                                              timeout=timeout, **kwargs) as response:
+                response.raise_for_status()
+                content = await response.read()
+        except asyncio.CancelledError:
+            # The hedge was won by another host
+            breaker.release()
+            raise
+        except Exception as err:
+            if is_async_retryable(err):
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            raise
+        breaker.record_success()
+        return decode(content) if decode is not None else json.loads(content)
+
+    async def _hedged(self, method, command, **kwargs):
+        # allow() is only asked of a host when a request is sent to it
+        hosts = iter(range(len(self.hosts)))
+        primary = next((index for index in hosts if self.breakers[index].allow()), None)
+        if primary is None:
+            raise CircuitOpenError(f'Circuit open for {command}')
+
+        pending = {asyncio.ensure_future(self._send(primary, method, command, **kwargs))}
+        done, _ = await asyncio.wait(pending, timeout=self.options.hedge_delay)
+        if not done:
+            pending |= {asyncio.ensure_future(self._send(index, method, command, **kwargs))
+                        for index in hosts if self.breakers[index].allow()}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+        finally:
+            for task in pending:
+                task.cancel()
+        raise error
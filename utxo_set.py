@@ -0,0 +1,158 @@
+"""
+Local UTXO set of a wallet.
+
+The set is loaded from Urchain on demand and updated optimistically as soon as a
+transaction is broadcast: its inputs are marked spent and its outputs paying to
+the wallet are added, as their txid and vout are known locally. A background
+refresh then reconciles the set with Urchain, which lags behind the mempool.
+"""
+from typing import Callable, List, Optional
+import copy
+import threading
+import time
+
+from btclib.tx.tx import Tx
+
+from n_types import IUtxo
+
+# Seconds the loaded set is served before it is fetched again
+DEFAULT_MAX_AGE = 15
+# Seconds a local update is kept while Urchain does not reflect it yet
+DEFAULT_PENDING_TTL = 600
+# Seconds between a broadcast and the background reconciliation
+DEFAULT_RECONCILE_DELAY = 5
+
+
+class UtxoSet:
+    """
+    Args:
+        fetch (Callable[[], List[IUtxo]]): Fetches the tracked UTXOs from Urchain.
+        owner (Callable[[bytes], Optional[IUtxo]]): Returns a template UTXO (script,
+            script_hash, type and private_key_wif) for an output script owned by
+            the wallet, or None.
+        max_age (float, optional): Seconds the set is served before it is refetched.
+        pending_ttl (float, optional): Seconds local updates are kept unconfirmed.
+        reconcile_delay (float, optional): Seconds before the background refresh
+            following a broadcast. None disables it.
+    """
+    def __init__(self,
+                 fetch: Callable[[], List[IUtxo]],
+                 owner: Callable[[bytes], Optional[IUtxo]],
+                 max_age: float = DEFAULT_MAX_AGE,
+                 pending_ttl: float = DEFAULT_PENDING_TTL,
+                 reconcile_delay: Optional[float] = DEFAULT_RECONCILE_DELAY,
+                 clock=time.monotonic):
+        self._fetch = fetch
+        self._owner = owner
+        self.max_age = max_age
+        self.pending_ttl = pending_ttl
+        self.reconcile_delay = reconcile_delay
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._remote = None
+        self._loaded_at = 0.0
+        # outpoint -> time of the local update
+        self._spent = {}
+        # outpoint -> (utxo, time of the local update)
+        self._created = {}
+        self._timer = None
+
+    @staticmethod
+    def outpoint(utxo):
+        return utxo.tx_id, utxo.output_index
+
+    def is_stale(self):
+        with self._lock:
+            return self._remote is None or self._clock() - self._loaded_at >= self.max_age
+
+    def utxos(self) -> List[IUtxo]:
+        """
+        Returns copies of the unspent outputs, fetching them if the set is stale.
+        """
+        if self.is_stale():
+            self.refresh()
+        with self._lock:
+            return [copy.copy(utxo) for utxo in self._view()]
+
+    def _view(self):
+        utxos = [utxo for utxo in self._remote if self.outpoint(utxo) not in self._spent]
+        remote = {self.outpoint(utxo) for utxo in self._remote}
+        utxos += [utxo for outpoint, (utxo, _) in self._created.items() if outpoint not in remote]
+        return utxos
+
+    def refresh(self):
+        """
+        Fetches the UTXOs from Urchain and drops the local updates it reflects
+        or that expired.
+        """
+        self.load(self._fetch())
+
+    def load(self, remote: List[IUtxo]):
+        """
+        Replaces the set with UTXOs fetched from Urchain, keeping the local updates
+        it does not reflect yet.
+        """
+        with self._lock:
+            now = self._clock()
+            outpoints = {self.outpoint(utxo) for utxo in remote}
+            # A spent outpoint missing from Urchain may not be indexed yet rather
+            # than confirmed spent, so spends are only dropped once expired
+            self._spent = {outpoint: at for outpoint, at in self._spent.items()
+                           if now - at < self.pending_ttl}
+            self._created = {outpoint: (utxo, at) for outpoint, (utxo, at) in self._created.items()
+                             if outpoint not in outpoints and now - at < self.pending_ttl}
+            self._remote = remote
+            self._loaded_at = now
+
+    def invalidate(self):
+        with self._lock:
+            self._remote = None
+
+    def apply_transaction(self, tx_hex: bytes):
+        """
+        Marks the inputs of a broadcast transaction spent and adds its outputs
+        paying to the wallet.
+        """
+        tx = Tx.parse(tx_hex)
+        tx_id = tx.id.hex()
+        created = []
+        for index, tx_out in enumerate(tx.vout):
+            template = self._owner(tx_out.script_pub_key.script)
+            if template is not None:
+                created.append(IUtxo(tx_id=tx_id,
+                                     output_index=index,
+                                     satoshis=tx_out.value,
+                                     script=template.script,
+                                     script_hash=template.script_hash,
+                                     type=template.type,
+                                     private_key_wif=template.private_key_wif))
+        with self._lock:
+            now = self._clock()
+            for tx_in in tx.vin:
+                outpoint = (tx_in.prev_out.tx_id.hex(), tx_in.prev_out.vout)
+                # A spent output created locally can still show up in Urchain
+                # once its transaction confirms, so its spend is kept as well
+                self._created.pop(outpoint, None)
+                self._spent[outpoint] = now
+            for utxo in created:
+                self._created[self.outpoint(utxo)] = (utxo, now)
+        self.reconcile_later()
+
+    def reconcile_later(self):
+        """
+        Schedules a background refresh after reconcile_delay seconds.
+        """
+        if self.reconcile_delay is None:
+            return
+        with self._lock:
+            if self._timer is not None and self._timer.is_alive():
+                return
+            self._timer = threading.Timer(self.reconcile_delay, self._reconcile)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _reconcile(self):
+        try:
+            self.refresh()
+        except Exception as err:
+            print(f'UTXO reconciliation failed: {err}')
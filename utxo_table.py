@@ -0,0 +1,134 @@
+"""
+Columnar storage of the UTXOs of many wallet accounts.
+
+A UtxoTable keeps one row per UTXO in parallel arrays: the txid bytes, the
+output index, the satoshis, an address type code and the position of the
+owning account. Scripts, script hashes and keys are not repeated per row, they
+are read from the owning account when an IUtxo is built, so a million UTXOs
+take a few tens of bytes each instead of an IUtxo object with its strings.
+"""
+from array import array
+from typing import Iterable, Iterator, List, Optional
+
+from n_types import IUtxo, IWalletAccount, AddressType
+
+# Address type codes of the type column
+_ADDRESS_TYPES = list(AddressType)
+_TYPE_CODES = {address_type: code for code, address_type in enumerate(_ADDRESS_TYPES)}
+
+_TXID_SIZE = 32
+
+
+class UtxoTable:
+    """
+    Args:
+        accounts (Iterable[IWalletAccount], optional): Accounts owning the rows.
+            Rows can only be added for UTXOs of a main or token address of these.
+    """
+    def __init__(self, accounts: Iterable[IWalletAccount] = ()):
+        self.accounts: List[IWalletAccount] = []
+        # script_hash -> (account position, address type code)
+        self._owners = {}
+        self._txids = bytearray()
+        self._vouts = array('L')
+        self._satoshis = array('Q')
+        self._types = array('B')
+        self._account_positions = array('L')
+        for account in accounts:
+            self.add_account(account)
+
+    def add_account(self, account: IWalletAccount) -> int:
+        """
+        Registers an account and returns its position.
+        """
+        position = len(self.accounts)
+        self.accounts.append(account)
+        for address in (account.main_address, account.token_address):
+            if address is not None:
+                self._owners[address.script_hash] = (position, _TYPE_CODES[AddressType(address.type)])
+        return position
+
+    def __len__(self):
+        return len(self._vouts)
+
+    def append(self, utxo: IUtxo):
+        owner = self._owners.get(utxo.script_hash)
+        if owner is None:
+            raise ValueError(f"UTXO {utxo.tx_id}:{utxo.output_index} is not owned by an account of the table")
+        position, type_code = owner
+        self._txids += bytes.fromhex(utxo.tx_id)
+        self._vouts.append(utxo.output_index)
+        self._satoshis.append(utxo.satoshis)
+        self._types.append(type_code)
+        self._account_positions.append(position)
+
+    def extend(self, utxos: Iterable[IUtxo]):
+        for utxo in utxos:
+            self.append(utxo)
+
+    def tx_id(self, row: int) -> str:
+        return self._txids[row * _TXID_SIZE:(row + 1) * _TXID_SIZE].hex()
+
+    def satoshis(self, row: int) -> int:
+        return self._satoshis[row]
+
+    def total_satoshis(self) -> int:
+        return sum(self._satoshis)
+
+    def __getitem__(self, row: int) -> IUtxo:
+        """
+        Builds the IUtxo of a row.
+        """
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError(row)
+        account = self.accounts[self._account_positions[row]]
+        address_type = _ADDRESS_TYPES[self._types[row]]
+        address = account.token_address \
+            if account.token_address is not None and AddressType(account.token_address.type) == address_type \
+            else account.main_address
+        return IUtxo(tx_id=self.tx_id(row),
+                     output_index=self._vouts[row],
+                     satoshis=self._satoshis[row],
+                     script=address.script,
+                     script_hash=address.script_hash,
+                     type=address_type,
+                     private_key_wif=account.private_key)
+
+    def __iter__(self) -> Iterator[IUtxo]:
+        return self.view()
+
+    def view(self, account: Optional[IWalletAccount] = None,
+             address_type: Optional[AddressType] = None) -> Iterator[IUtxo]:
+        """
+        Yields the IUtxo of the rows, optionally only those of an account or of
+        an address type, building each one on demand.
+        """
+        position = None
+        if account is not None:
+            position = next((i for i, known in enumerate(self.accounts) if known is account), None)
+            if position is None:
+                return
+        type_code = _TYPE_CODES[AddressType(address_type)] if address_type is not None else None
+        for row in range(len(self)):
+            if position is not None and self._account_positions[row] != position:
+                continue
+            if type_code is not None and self._types[row] != type_code:
+                continue
+            yield self[row]
+
+    def discard(self, outpoints: Iterable[tuple]):
+        """
+        Removes the rows of (tx_id, output_index) outpoints, e.g. once spent.
+        """
+        outpoints = {(bytes.fromhex(tx_id), output_index) for tx_id, output_index in outpoints}
+        keep = [row for row in range(len(self))
+                if (bytes(self._txids[row * _TXID_SIZE:(row + 1) * _TXID_SIZE]), self._vouts[row]) not in outpoints]
+        if len(keep) == len(self):
+            return
+        self._txids = bytearray().join(self._txids[row * _TXID_SIZE:(row + 1) * _TXID_SIZE] for row in keep)
+        self._vouts = array('L', (self._vouts[row] for row in keep))
+        self._satoshis = array('Q', (self._satoshis[row] for row in keep))
+        self._types = array('B', (self._types[row] for row in keep))
+        self._account_positions = array('L', (self._account_positions[row] for row in keep))
@@ -1,29 +1,86 @@
-from typing import List
+from typing import Iterable, List
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+import threading
 from abc import abstractmethod
 
 import msgpack
 import bip32utils
 from mnemonic import Mnemonic
 
-from urchain import Urchain
+from urchain import Urchain, AsyncUrchain
+from utxo_set import UtxoSet
+from utxo_table import UtxoTable
+from hd_keys import derive_children, secret_to_wif
+from account_cache import AccountCache, AccountCollection, LazyWalletAccount, account_cache_path
 from config import CoinConfig
 from n_types import *
 
+
+# Ranges below this size are derived in the calling process
+PARALLEL_DERIVATION_MIN_ACCOUNTS = 1000
+# Shards per worker process, so uneven shards still keep every worker busy
+DERIVATION_SHARDS_PER_PROCESS = 4
+# Consecutive unused accounts after which discovery stops
+DEFAULT_GAP_LIMIT = 20
+
+
+def derive_account_records(secret: bytes, chain_code: bytes, indexes: List[int], target: int,
+                           testnet: bool, account_record=None):
+    """
+    Returns (index, private_key, public_key, record) tuples of the accounts of
+    indexes below an account node, record being account_record's result or None.
+    """
+    records = []
+    for index, child_secret, pubkey in derive_children(secret, chain_code, indexes, target):
+        private_key = secret_to_wif(child_secret, testnet)
+        public_key = pubkey.hex()
+        records.append((index, private_key, public_key,
+                        account_record(private_key, public_key, testnet) if account_record else None))
+    return records
+
+
+@lru_cache(maxsize=4)
+def mnemonic_seed(mnemonic_str: str) -> bytes:
+    """
+    Returns the BIP39 seed of the mnemonic. The 2048 PBKDF2 rounds run once per
+    mnemonic, the wallets of every network share the result.
+    """
+    return Mnemonic.to_seed(mnemonic_str)
+
+
 class Wallet:
     def __init__(self, mnemonic: str, config: CoinConfig, lang: str = "english"):
         self.config = config
         self.lang = lang
-        self.urchain = Urchain(config.urchain['host'], config.urchain['apiKey'])
+        self.urchain = Urchain(config.urchain['host'], config.urchain['apiKey'], config.urchain)
+        self.async_urchain = AsyncUrchain(config.urchain['host'], config.urchain['apiKey'], config.urchain)
+        # Main and token address UTXOs of every account, updated after each broadcast
+        self.utxo_set = UtxoSet(self._fetch_tracked_utxos, self._owned_output)
         self._account_index = 0
         self.current_account = None
-        self.account_collection = {}
+        self.account_collection = AccountCollection()
+        # (account_collection version, script -> (account, address), token script hashes)
+        self._script_index = None
         self.wallet = None
         self.root_hd_private_key = None
         self.child_hd_key = None
+        # Hardened account nodes by (root, root_path1, root_path2)
+        self._account_nodes = {}
+        # Open account caches by file path
+        self._account_caches = {}
 
         self.import_mnemonic(mnemonic, lang)
 
-        self.urchain.health()
+        # Startup does not wait on Urchain, an unreachable host is only reported
+        threading.Thread(target=self.check_health, daemon=True).start()
+
+    def check_health(self):
+        try:
+            return self.urchain.health()
+        except Exception as err:
+            print(f'Urchain health check failed: {err}')
+            return None
 
     @property
     def explorer(self):
@@ -52,16 +109,61 @@ class Wallet:
             mnemonic_str = mnemonic.generate()
 
         self.mnemonic = mnemonic_str
-        seed = mnemonic.to_seed(mnemonic_str)
+        seed = mnemonic_seed(mnemonic_str)
         # Create a BIP32 root key (master key) from the seed
         self.root_hd_private_key = bip32utils.BIP32Key.fromEntropy(
             seed,
             testnet= self.config.network == "testnet")
+        self._account_nodes = {}
         root_path1 = 0
         if self.config.network == "testnet":
             root_path1 = 1
         self.current_account = self.create_account(44, root_path1, 0, 0, 0)
 
+    def _account_node(self, root: int, root_path1: int, root_path2: int):
+        """
+        Returns the hardened m/root'/root_path1'/root_path2' node, derived once per path.
+        """
+        path = (root, root_path1, root_path2)
+        node = self._account_nodes.get(path)
+        if node is None:
+            node = self.root_hd_private_key.ChildKey(root + bip32utils.BIP32_HARDEN).ChildKey(
+                root_path1 + bip32utils.BIP32_HARDEN).ChildKey(root_path2 + bip32utils.BIP32_HARDEN)
+            self._account_nodes[path] = node
+        return node
+
+    # Module-level function (private_key, public_key, testnet) -> record, computing
+    # what a coin adds to a derived account. It runs in the derivation workers.
+    account_record = None
+
+    def apply_account_record(self, account: IWalletAccount, record) -> IWalletAccount:
+        return account
+
+    def public_account_record(self, account: IWalletAccount) -> tuple:
+        """
+        Returns what a coin adds to an account that can be kept in the account
+        cache, i.e. everything but the private fields.
+        """
+        return ()
+
+    def apply_public_record(self, account: IWalletAccount, record) -> IWalletAccount:
+        return account
+
+    def init_private_fields(self, account: IWalletAccount):
+        """
+        Completes the private fields of a cached account once its private key is set.
+        """
+
+    def init_account(self, account: IWalletAccount) -> IWalletAccount:
+        """
+        Completes a derived account, e.g. with its addresses, before it is added.
+        """
+        if self.account_record is None:
+            return account
+        return self.apply_account_record(
+            account,
+            self.account_record(account.private_key, account.public_key, self.config.network == "testnet"))
+
     def create_account(self,
                        root: int,
                        root_path1: int,
@@ -69,8 +171,7 @@ class Wallet:
                        index: int,
                        target: int) -> IWalletAccount:
         ext_path = f'm/{index}/{target}'
-        root_hd_key = self.root_hd_private_key.ChildKey(root + bip32utils.BIP32_HARDEN).ChildKey(
-            root_path1 + bip32utils.BIP32_HARDEN).ChildKey(root_path2 + bip32utils.BIP32_HARDEN)
+        root_hd_key = self._account_node(root, root_path1, root_path2)
 
         self.child_hd_key = root_hd_key.ChildKey(index).ChildKey(target)
 
@@ -80,9 +181,126 @@ class Wallet:
                                  xpub=root_hd_key.ExtendedKey(private=False, encoded=True),
                                  private_key=self.child_hd_key.WalletImportFormat(),
                                  public_key=self.child_hd_key.PublicKey().hex())
+        account = self.init_account(account)
         self.account_collection[ext_path] = account
+        # The loaded set does not cover the new account
+        self.utxo_set.invalidate()
         return account
 
+    def derive_accounts(self,
+                        root: int,
+                        root_path1: int,
+                        root_path2: int,
+                        indexes: Iterable[int],
+                        target: int = 0,
+                        processes: Optional[int] = None) -> List[IWalletAccount]:
+        """
+        Derives and adds the accounts of a range of indexes.
+
+        The account node is derived once and the keys below it are derived with
+        hd_keys, without the pure-Python EC arithmetic of bip32utils. The
+        accounts equal those of create_account.
+
+        Args:
+            processes (int, optional): Derive large ranges in that many worker
+                processes, each taking contiguous shards of indexes.
+        """
+        accounts = self._derive_accounts(root, root_path1, root_path2, indexes, target, processes)
+        for account in accounts:
+            self.account_collection[account.ext_path] = account
+        # The loaded set does not cover the new accounts
+        self.utxo_set.invalidate()
+        return accounts
+
+    def _derive_accounts(self,
+                         root: int,
+                         root_path1: int,
+                         root_path2: int,
+                         indexes: Iterable[int],
+                         target: int = 0,
+                         processes: Optional[int] = None) -> List[IWalletAccount]:
+        root_hd_key = self._account_node(root, root_path1, root_path2)
+        xpub = root_hd_key.ExtendedKey(private=False, encoded=True)
+        derive = partial(derive_account_records,
+                         root_hd_key.PrivateKey(),
+                         root_hd_key.ChainCode(),
+                         target=target,
+                         testnet=self.config.network == "testnet",
+                         account_record=self.account_record)
+
+        indexes = list(indexes)
+        if processes is not None and processes > 1 and len(indexes) >= PARALLEL_DERIVATION_MIN_ACCOUNTS:
+            shard_size = -(-len(indexes) // (processes * DERIVATION_SHARDS_PER_PROCESS))
+            shards = [indexes[i:i + shard_size] for i in range(0, len(indexes), shard_size)]
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                # map returns the shards in submission order, hence in index order
+                records = [record for shard in executor.map(derive, shards) for record in shard]
+        else:
+            records = derive(indexes)
+
+        accounts = []
+        for index, private_key, public_key, record in records:
+            account = IWalletAccount(target=target,
+                                     index=index,
+                                     ext_path=f'm/{index}/{target}',
+                                     xpub=xpub,
+                                     private_key=private_key,
+                                     public_key=public_key)
+            if record is not None:
+                account = self.apply_account_record(account, record)
+            accounts.append(account)
+        return accounts
+
+    def load_accounts(self,
+                      root: int,
+                      root_path1: int,
+                      root_path2: int,
+                      n: int,
+                      target: int = 0,
+                      processes: Optional[int] = None):
+        """
+        Adds the accounts of indexes 0..n-1 through the account cache of
+        config.account_cache_dir, deriving only those past the cached ones.
+
+        Cached accounts are read when first accessed and derive their private
+        key on first use.
+        """
+        root_hd_key = self._account_node(root, root_path1, root_path2)
+        xpub = root_hd_key.ExtendedKey(private=False, encoded=True)
+        path = account_cache_path(self.config.account_cache_dir,
+                                  self.root_hd_private_key.Fingerprint().hex(),
+                                  self.config.network, root, root_path1, root_path2, target)
+        cache = self._account_caches.get(path)
+        if cache is None:
+            cache = self._account_caches[path] = AccountCache(path, xpub)
+
+        if len(cache) < n:
+            accounts = self.derive_accounts(root, root_path1, root_path2, range(len(cache), n), target, processes)
+            cache.extend((account.public_key, *self.public_account_record(account)) for account in accounts)
+
+        resolve = partial(self._resolve_private_fields, root, root_path1, root_path2)
+
+        def build(index):
+            public_key, *record = cache.record(index)
+            account = LazyWalletAccount(resolve,
+                                        target=target,
+                                        index=index,
+                                        ext_path=f'm/{index}/{target}',
+                                        xpub=xpub,
+                                        public_key=public_key)
+            return self.apply_public_record(account, record)
+
+        self.account_collection.attach(cache, target, build, n)
+        # The loaded set does not cover the new accounts
+        self.utxo_set.invalidate()
+
+    def _resolve_private_fields(self, root: int, root_path1: int, root_path2: int, account: IWalletAccount):
+        root_hd_key = self._account_node(root, root_path1, root_path2)
+        (_, secret, _), = derive_children(root_hd_key.PrivateKey(), root_hd_key.ChainCode(),
+                                          [account.index], account.target)
+        account.private_key = secret_to_wif(secret, self.config.network == "testnet")
+        self.init_private_fields(account)
+
     def switch_account(self, index: int):
         self._account_index = index
         exist_account = self.account_collection.get(f"{self.config.path_r}/0/{index}")
@@ -94,17 +312,76 @@ class Wallet:
                                                        self.config.path_r_s2, 0, index)
         return self.current_account
 
-    def generate_spec_accounts(self, root: int, root_s1:int, root_s2:int, n: int, target: int = 0):
-        for i in range(n):
-            self.create_account(root, root_s1, root_s2, i, target)
+    def generate_spec_accounts(self, root: int, root_s1:int, root_s2:int, n: int, target: int = 0,
+                               processes: Optional[int] = None):
+        if self.config.account_cache_dir:
+            self.load_accounts(root, root_s1, root_s2, n, target, processes)
+        else:
+            self.derive_accounts(root, root_s1, root_s2, range(n), target, processes)
         return list(self.account_collection.keys())
 
-    def generate_accounts(self, n: int, target: int = 0):
+    def generate_accounts(self, n: int, target: int = 0, processes: Optional[int] = None):
         return self.generate_spec_accounts(self.config.path_r,
                                            self.config.path_r_s1,
                                            self.config.path_r_s2,
                                            n,
-                                           target)
+                                           target,
+                                           processes)
+
+    def discover_spec_accounts(self, root: int, root_s1: int, root_s2: int, target: int = 0,
+                               gap_limit: int = DEFAULT_GAP_LIMIT, window: Optional[int] = None,
+                               processes: Optional[int] = None) -> List[IWalletAccount]:
+        """
+        Finds the used accounts, i.e. those with UTXOs or tokens on their main
+        or token address, and adds only these to account_collection.
+
+        Accounts are derived `window` indexes at a time. The UTXOs of a whole
+        window are fetched with one batched utxos lookup, then the token lists
+        of the accounts without UTXOs are fetched in parallel. Discovery stops
+        after gap_limit consecutive unused indexes.
+        """
+        window = window or gap_limit
+        used = []
+        gap = 0
+        start = 0
+        while gap < gap_limit:
+            accounts = self._derive_accounts(root, root_s1, root_s2, range(start, start + window), target, processes)
+            script_hashs = [script_hash for account in accounts
+                            for script_hash in (account.main_address.script_hash, account.token_address.script_hash)]
+            used_script_hashs = {utxo.script_hash for utxo in self.urchain.utxos(script_hashs)}
+            # Token outputs are looked up apart from the utxos of an address
+            unfunded = [script_hash for account in accounts
+                        if account.main_address.script_hash not in used_script_hashs and
+                        account.token_address.script_hash not in used_script_hashs
+                        for script_hash in (account.main_address.script_hash, account.token_address.script_hash)]
+            used_script_hashs.update(script_hash for script_hash, tokens
+                                     in self.urchain.token_lists(unfunded).items() if tokens)
+            for account in accounts:
+                if account.main_address.script_hash in used_script_hashs or \
+                        account.token_address.script_hash in used_script_hashs:
+                    used.append(account)
+                    gap = 0
+                else:
+                    gap += 1
+                    if gap >= gap_limit:
+                        break
+            start += window
+
+        for account in used:
+            self.account_collection[account.ext_path] = account
+        # The loaded set does not cover the new accounts
+        self.utxo_set.invalidate()
+        return used
+
+    def discover_accounts(self, target: int = 0, gap_limit: int = DEFAULT_GAP_LIMIT, window: Optional[int] = None,
+                          processes: Optional[int] = None) -> List[IWalletAccount]:
+        return self.discover_spec_accounts(self.config.path_r,
+                                           self.config.path_r_s1,
+                                           self.config.path_r_s2,
+                                           target,
+                                           gap_limit,
+                                           window,
+                                           processes)
 
     @property
     def main_script_hash_list(self):
@@ -133,7 +410,7 @@ class Wallet:
             raise Exception("No UTXOs found")
         return token_utxos
 
-    def fetch_all_account_utxos(self, include_unbonded_token_utxos: bool = False) -> List[IUtxo]:
+    def _all_account_script_hashs(self, include_unbonded_token_utxos: bool = False):
         all_script_hashs = []
         all_accounts = {}
         for account in self.account_collection.values():
@@ -142,7 +419,10 @@ class Wallet:
             if include_unbonded_token_utxos:
                 all_script_hashs.append(account.token_address.script_hash)
                 all_accounts[account.token_address.script_hash] = account
-        all_utxos = self.urchain.utxos(all_script_hashs)
+        return all_script_hashs, all_accounts
+
+    @staticmethod
+    def _bind_account_utxos(all_utxos: List[IUtxo], all_accounts) -> List[IUtxo]:
         for utxo in all_utxos:
             account = all_accounts.get(utxo.script_hash)
             if account:
@@ -153,6 +433,80 @@ class Wallet:
                     utxo.type = account.token_address.type
         return all_utxos
 
+    def _fetch_tracked_utxos(self) -> List[IUtxo]:
+        all_script_hashs, all_accounts = self._all_account_script_hashs(True)
+        return self._bind_account_utxos(self.urchain.utxos(all_script_hashs), all_accounts)
+
+    def _indexed_scripts(self):
+        """
+        Returns the script -> (account, address) index and the token script hashes
+        of account_collection, rebuilt only after it changed.
+        """
+        index = self._script_index
+        version = self.account_collection.version
+        if index is None or index[0] != version:
+            scripts = {}
+            token_script_hashs = set()
+            for account in self.account_collection.values():
+                for address in (account.main_address, account.token_address):
+                    scripts.setdefault(address.script, (account, address))
+                token_script_hashs.add(account.token_address.script_hash)
+            index = self._script_index = (version, scripts, token_script_hashs)
+        return index[1], index[2]
+
+    def _owned_output(self, script: bytes) -> Optional[IUtxo]:
+        scripts, _ = self._indexed_scripts()
+        owner = scripts.get(bytes(script))
+        if owner is None:
+            return None
+        account, address = owner
+        return IUtxo(tx_id='', output_index=0, satoshis=0,
+                     script=address.script,
+                     script_hash=address.script_hash,
+                     type=address.type,
+                     private_key_wif=account.private_key)
+
+    def _filter_unbonded_token_utxos(self, utxos: List[IUtxo],
+                                     include_unbonded_token_utxos: bool) -> List[IUtxo]:
+        if include_unbonded_token_utxos:
+            return utxos
+        _, token_script_hashs = self._indexed_scripts()
+        return [utxo for utxo in utxos if utxo.script_hash not in token_script_hashs]
+
+    def fetch_all_account_utxos(self, include_unbonded_token_utxos: bool = False) -> List[IUtxo]:
+        """
+        Returns the UTXOs of every account from the local UTXO set, which is refetched
+        from Urchain when stale.
+        """
+        return self._filter_unbonded_token_utxos(self.utxo_set.utxos(), include_unbonded_token_utxos)
+
+    def fetch_utxo_table(self, include_unbonded_token_utxos: bool = False) -> UtxoTable:
+        """
+        Fetches the UTXOs of every account from Urchain into a UtxoTable, chunk by
+        chunk, for holdings too large to keep as IUtxo objects.
+        """
+        accounts = list(self.account_collection.values())
+        table = UtxoTable(accounts)
+        script_hashs = [account.main_address.script_hash for account in accounts]
+        if include_unbonded_token_utxos:
+            script_hashs += [account.token_address.script_hash for account in accounts]
+        for utxos in self.urchain.iter_utxos(script_hashs):
+            table.extend(utxos)
+        return table
+
+    def _track_broadcast(self, tx_hex, result):
+        """
+        Applies a successfully broadcast transaction to the local UTXO set.
+        """
+        success = result.get('success') if isinstance(result, dict) else getattr(result, 'success', False)
+        if not success:
+            return
+        try:
+            self.utxo_set.apply_transaction(bytes.fromhex(tx_hex) if isinstance(tx_hex, str) else bytes(tx_hex))
+        except Exception as err:
+            print(f'Cannot apply the transaction to the UTXO set: {err}')
+            self.utxo_set.invalidate()
+
     @abstractmethod
     def build_n20_transaction(
         self,
@@ -176,7 +530,9 @@ class Wallet:
         pass
 
     def broadcast_transaction(self, tx: ITransaction) -> IBroadcastResult:
-        return self.urchain.broadcast(tx.tx_hex)
+        result = self.urchain.broadcast(tx.tx_hex)
+        self._track_broadcast(tx.tx_hex, result)
+        return result
 
     def mint(self, payload: NotePayload, _to_address: Optional[str] = None):
         tx = self.build_n20_transaction(payload)
@@ -184,9 +540,8 @@ class Wallet:
 
     def build_n20_payload(self, data: Union[str, dict], use_script_size: bool = False):
         encoded_data = msgpack.packb(data, use_bin_type=True)
-        buffer = encoded_data.hex()
         payload = NotePayload(
-            data0=buffer, data1="", data2="", data3="", data4="",
+            data0=encoded_data, data1=b"", data2=b"", data3=b"", data4=b"",
         )
         return payload
 
@@ -201,3 +556,37 @@ class Wallet:
     def all_tokens(self):
         results = self.urchain.all_tokens()
         return results
+
+    # asyncio variants, requests go through async_urchain
+
+    async def async_get_token_utxos(self, tick: str, amount: Optional[int]):
+        token_utxos = await self.async_urchain.tokenutxos(
+            [self.current_account.token_address.script_hash], tick, amount)
+        if len(token_utxos) == 0:
+            raise Exception("No UTXOs found")
+        return token_utxos
+
+    async def async_fetch_all_account_utxos(self,
+                                            include_unbonded_token_utxos: bool = False) -> List[IUtxo]:
+        if self.utxo_set.is_stale():
+            all_script_hashs, all_accounts = self._all_account_script_hashs(True)
+            self.utxo_set.load(
+                self._bind_account_utxos(await self.async_urchain.utxos(all_script_hashs), all_accounts))
+        return self._filter_unbonded_token_utxos(self.utxo_set.utxos(), include_unbonded_token_utxos)
+
+    async def async_broadcast_transaction(self, tx: ITransaction) -> IBroadcastResult:
+        result = await self.async_urchain.broadcast(tx.tx_hex)
+        self._track_broadcast(tx.tx_hex, result)
+        return result
+
+    async def async_best_block(self):
+        return await self.async_urchain.best_block()
+
+    async def async_token_info(self, tick: str):
+        return await self.async_urchain.token_info(tick)
+
+    async def async_all_tokens(self):
+        return await self.async_urchain.all_tokens()
+
+    async def async_close(self):
+        await self.async_urchain.close()